@@ -0,0 +1,248 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+'''
+benchmarks for simulation, parameter sweeps and storage
+
+    python benchmarks/benchmark.py                                   quick grid, results to benchmarks/results.json
+    python benchmarks/benchmark.py --grid full --output new.json     N from 10^2 to 10^5
+    python benchmarks/benchmark.py --baseline old.json --time-threshold 0.2
+
+every case reports the best wall time of --repeat runs, the peak traced memory of one extra run
+and a throughput (steps/s, settings/s or MB/s). With --baseline the results are compared case by
+case and the script exits with status 1 if a case got slower or larger than the thresholds allow
+(relative increase). Runs offline, experiments are written to the data/ directory and removed afterwards
+'''
+
+import os
+import os.path as path
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import platform
+import warnings
+import tracemalloc
+import contextlib
+import numpy as np
+
+sys.path.insert(0, path.abspath(path.join(__file__, "../..")))
+
+from submanifolds.ringnet import Parameters, RingNetwork
+from submanifolds.ringnet.parameters import clear_cache
+from submanifolds.experiments import WeightMatrixExperiment
+from submanifolds.utils import DataManager, get_root
+
+GRIDS = {
+    'quick': {'N': [100, 1000], 'T': [100], 'sweep': [4], 'backend': ['pickle', 'array']},
+    'full':  {'N': [100, 1000, 10000, 100000], 'T': [100, 1000], 'sweep': [16, 64], 'backend': ['pickle', 'array']},
+}
+DENSE_LIMIT = 10000     # largest N for which the dense N x N weight matrix is built
+
+def parameters(**values):
+    return Parameters({'keys': list(values), 'setting': list(values.values())})
+
+def sparse_values(N):
+    # fixed kernel width in neurons so the number of synapses grows linearly with N
+    return {'connectivity': 'sparse', 'cutoff': 4, 'sigma_percent': 20 / N, 'shift_percent': 10 / N}
+
+
+'''
+cases, each returns (setup, run, work, unit): run(state) is timed, setup() is not, work is the
+amount of work per run in unit (throughput = work / time)
+'''
+def case_parameters(N):
+    def run(state):
+        clear_cache()
+        parameters(N=N)
+    return (lambda: None), run, 1, 'settings/s'
+
+def case_weight_matrix(N):
+    def setup():
+        net = RingNetwork(parameters(N=N))
+        net._build()
+        return net
+    def run(net):
+        net._W = None
+        net.W
+    return setup, run, N * N * 8 / 2**20, 'MB/s'
+
+def case_run(N, T, engine):
+    values = sparse_values(N) if engine == 'sparse' else {'engine': engine}
+    def setup():
+        net = RingNetwork(parameters(N=N, T=T, **values))
+        net._build()
+        if engine == 'dense':
+            net.W
+        return net
+    def run(net):
+        net.run(record=True)
+    return setup, run, T, 'steps/s'
+
+def case_sweep(size, N, T, backend):
+    settings = {'seed': list(range(size))}
+    def run(state):
+        experiment = WeightMatrixExperiment({'N': [N], 'T': [T]}, settings, name=unique_name('benchmark_sweep'), backend=backend)
+        try:
+            experiment.iterate()
+        finally:
+            shutil.rmtree(experiment.exp_dir)
+    return (lambda: None), run, size, 'settings/s'
+
+def case_save(size, N, T, backend):
+    def setup():
+        experiment = WeightMatrixExperiment({'N': [N], 'T': [T]}, {'seed': list(range(size))}, name=unique_name('benchmark_save'), backend=backend)
+        networks = [RingNetwork(parameters(N=N, T=T, seed=seed)) for seed in range(size)]
+        for net in networks:
+            net.run(record=True)
+        return experiment, networks
+    def run(state):
+        experiment, networks = state
+        for counter, net in enumerate(networks):
+            experiment.save_data(counter, net)
+        if experiment.store is not None:
+            experiment.store.flush()
+    return setup, run, size * N * T * 8 / 2**20, 'MB/s'
+
+def case_load(size, N, T, backend):
+    def setup():
+        experiment = WeightMatrixExperiment({'N': [N], 'T': [T]}, {'seed': list(range(size))}, name=unique_name('benchmark_load'), backend=backend)
+        experiment.iterate()
+        return path.basename(experiment.exp_dir[:-1]), experiment.param_space
+    def run(state):
+        name, param_space = state
+        data = DataManager(name)
+        for setting in param_space:
+            np.sum(data.load_data(setting).R)
+    return setup, run, size * N * T * 8 / 2**20, 'MB/s'
+
+def cases(grid):
+    g = GRIDS[grid]
+    T0 = g['T'][0]
+    for N in g['N']:
+        yield 'parameters/N=' + str(N), case_parameters(N)
+        if N <= DENSE_LIMIT:
+            yield 'weight_matrix/N=' + str(N), case_weight_matrix(N)
+        for T in g['T']:
+            for engine in ['dense', 'fft', 'sparse']:
+                if engine == 'dense' and N > DENSE_LIMIT:
+                    continue
+                yield 'run/' + engine + '/N=' + str(N) + '/T=' + str(T), case_run(N, T, engine)
+    for size in g['sweep']:
+        for backend in g['backend']:
+            suffix = '/' + backend + '/settings=' + str(size) + '/N=' + str(g['N'][0]) + '/T=' + str(T0)
+            yield 'sweep' + suffix, case_sweep(size, g['N'][0], T0, backend)
+            yield 'save' + suffix, case_save(size, g['N'][0], T0, backend)
+            yield 'load' + suffix, case_load(size, g['N'][0], T0, backend)
+
+
+'''
+measurement
+'''
+_names = []
+def unique_name(prefix):
+    # experiment directories are named by the second they were created, keep names apart
+    _names.append(prefix)
+    return prefix + '_' + str(os.getpid()) + '_' + str(len(_names))
+
+def measure(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+
+    # separate run for memory, tracing slows down allocation heavy code
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), peak / 2**20
+
+def run_benchmarks(grid, repeat, select=None):
+    results = {}
+    data_dir = get_root() + 'data/'
+    os.makedirs(data_dir, exist_ok=True)
+    before = set(os.listdir(data_dir))
+    try:
+        for name, (setup, run, work, unit) in cases(grid):
+            if select is not None and select not in name:
+                continue
+            print('\r' + name + ' ' * 20, end='', file=sys.stderr)
+            with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                seconds, peak = measure(setup, run, repeat)
+            results[name] = {'time': seconds, 'peak_mb': peak, 'throughput': work / seconds, 'unit': unit}
+    finally:
+        # remove every experiment directory the benchmarks created
+        for name in set(os.listdir(data_dir)) - before:
+            if name.startswith('benchmark_'):
+                shutil.rmtree(data_dir + name, ignore_errors=True)
+    print('', file=sys.stderr)
+    return results
+
+def compare(results, baseline, time_threshold, memory_threshold, time_floor=1e-3):
+    '''
+    regressions of results against baseline, a list of (case, quantity, baseline value, new value).
+    Differences below time_floor seconds (or 0.1 MB) are timer and allocator noise
+    '''
+    regressions = []
+    for name, new in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if new['time'] > old['time'] * (1 + time_threshold) and new['time'] - old['time'] > time_floor:
+            regressions.append((name, 'time', old['time'], new['time']))
+        if new['peak_mb'] > old['peak_mb'] * (1 + memory_threshold) and new['peak_mb'] - old['peak_mb'] > 0.1:
+            regressions.append((name, 'peak_mb', old['peak_mb'], new['peak_mb']))
+    return regressions
+
+def metadata(grid, repeat):
+    return {'grid': grid,
+            'repeat': repeat,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for simulation, parameter sweeps and storage.')
+    parser.add_argument('--grid', choices=list(GRIDS), default='quick')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case, the best is reported')
+    parser.add_argument('--select', default=None, help='only run cases whose name contains this text')
+    parser.add_argument('--output', default=path.join(path.dirname(path.abspath(__file__)), 'results.json'))
+    parser.add_argument('--baseline', default=None, help='results file of an earlier run to compare against')
+    parser.add_argument('--time-threshold', type=float, default=0.25, help='allowed relative increase of wall time')
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help='allowed relative increase of peak memory')
+    parser.add_argument('--time-floor', type=float, default=1e-3, help='absolute time difference (s) below which no regression is reported')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.grid, args.repeat, args.select)
+    with open(args.output, 'w') as f:
+        json.dump({'metadata': metadata(args.grid, args.repeat), 'results': results}, f, indent=2)
+
+    for name, result in results.items():
+        print('%-55s %10.4f s %10.1f MB %12.1f %s' % (name, result['time'], result['peak_mb'], result['throughput'], result['unit']))
+    print('Results written to ' + args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold, args.time_floor)
+        for name, quantity, old, new in regressions:
+            print('Regression: %s %s %.4g -> %.4g (%+.0f%%)' % (name, quantity, old, new, 100 * (new / old - 1)))
+        if regressions:
+            return 1
+        print('No regressions against ' + args.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+'''
+run a parameter sweep from a spec file, without a notebook and without a display
+
+    python -m submanifolds sweep.json
+    python -m submanifolds sweep.json --workers 8 --backend array --figures
+    python -m submanifolds sweep.json --dry-run
+
+the spec is a JSON object with the keyword arguments of the experiment, parameter values are
+lists as in the notebooks:
+
+    {
+        "name": "shift_sweep",
+        "params_to_set": {"N": [1000], "T": [500]},
+        "params_to_iterate": {"shift_percent": [0.01, 0.02], "seed": [0, 1, 2]},
+        "backend": "array",
+        "workers": 4,
+        "observers": ["BumpCenter", {"type": "DecimatedRaster", "every": 5}],
+        "cache": true
+    }
+
+"experiment" selects the experiment class (default "weight_matrix"), "observers" are names of
+ringnet.observers classes or objects with a "type" and their keyword arguments, "cache" is true
+(default cache directory) or a cache directory. The "metric" of an "adaptive" experiment is the
+name of a function in experiments.adaptive_experiment.METRICS or "module:function".
+Command line options override the spec.
+Only the simulation modules are imported, matplotlib is loaded for --figures alone
+'''
+
+import sys
+import os.path as path
+import json
+import inspect
+import importlib
+import argparse
+import math
+
+EXPERIMENTS = {'weight_matrix': 'WeightMatrixExperiment', 'adaptive': 'AdaptiveExperiment', 'ensemble': 'EnsembleExperiment'}
+
+def build_observers(specs):
+    from . import ringnet
+    observers = []
+    for spec in specs:
+        if isinstance(spec, str):
+            spec = {'type': spec}
+        kwargs = dict(spec)
+        name = kwargs.pop('type', None)
+        observer = getattr(ringnet, str(name), None)
+        if not (inspect.isclass(observer) and issubclass(observer, ringnet.Observer)):
+            raise Exception("Keyword '" + str(name) + "' is not a valid observer. Please choose BumpCenter, BumpWidth, PeakRate, TotalActivity or DecimatedRaster.")
+        observers.append(observer(**kwargs))
+    return observers
+
+def resolve_metric(name):
+    from .experiments.adaptive_experiment import METRICS
+    if ':' in name:
+        module, function = name.split(':')
+        return getattr(importlib.import_module(module), function)
+    if name not in METRICS:
+        raise Exception("Keyword '" + name + "' is not a valid metric. Please choose " + ' or '.join("'" + key + "'" for key in METRICS) + " or give 'module:function'.")
+    return METRICS[name]
+
+def experiment_class(spec):
+    name = spec.get('experiment', 'weight_matrix')
+    if name not in EXPERIMENTS:
+        raise Exception("Keyword '" + str(name) + "' is not a valid experiment. Please choose " + ' or '.join("'" + key + "'" for key in EXPERIMENTS) + ".")
+    from . import experiments
+    return getattr(experiments, EXPERIMENTS[name])
+
+def experiment_kwargs(spec, cls):
+    '''
+    constructor keywords of cls from the spec, observers are built from their descriptions. The
+    cache is left as it is in the spec, build_cache creates it once the sweep really runs
+    '''
+    kwargs = {key: value for key, value in spec.items() if key != 'experiment'}
+    allowed = []
+    for base in cls.__mro__:
+        # keywords passed on to the parent class through **kwargs are valid too
+        parameters = inspect.signature(base.__init__).parameters.values()
+        allowed += [parameter.name for parameter in parameters if parameter.kind == parameter.POSITIONAL_OR_KEYWORD
+                    and parameter.name != 'self' and parameter.name not in allowed]
+        if not any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+            break
+    for key in kwargs:
+        if key not in allowed:
+            raise Exception("Keyword '" + key + "' is not a valid option of " + cls.__name__ + ". Please choose from " + ', '.join(allowed) + ".")
+
+    if kwargs.get('observers') is not None:
+        kwargs['observers'] = build_observers(kwargs['observers'])
+    if isinstance(kwargs.get('metric'), str):
+        kwargs['metric'] = resolve_metric(kwargs['metric'])
+    return kwargs
+
+def build_cache(kwargs):
+    # true is the default cache directory, a string a cache directory, creating it makes the directory
+    cache = kwargs.get('cache')
+    if cache is not None and cache is not False:
+        from .utils import ResultCache
+        kwargs['cache'] = ResultCache(None if cache is True else cache)
+    elif cache is False:
+        kwargs['cache'] = None
+    return kwargs
+
+def load_spec(filename):
+    with open(filename) as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise Exception("The spec in '" + filename + "' has to be a JSON object.")
+    for key in ['params_to_set', 'params_to_iterate']:
+        spec.setdefault(key, {})
+        for name, values in spec[key].items():
+            # a single value is a sweep over one value
+            if not isinstance(values, list):
+                spec[key][name] = [values]
+    return spec
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m submanifolds', description='Run a parameter sweep from a JSON spec file.')
+    parser.add_argument('spec', help='JSON file with the experiment keywords')
+    parser.add_argument('--name', default=None, help='experiment name, the data directory is data/<name>_<date>/')
+    parser.add_argument('--workers', type=int, default=None, help='simulate in a process pool with this many workers')
+    parser.add_argument('--batch-size', type=int, default=None, help='simulate compatible settings together in batches')
+    parser.add_argument('--backend', choices=['pickle', 'array'], default=None)
+    parser.add_argument('--profile', action='store_true', help='save timings to metadata/profile.json')
+    parser.add_argument('--figures', action='store_true', help='render the activity rasters to figures/ after the run')
+    parser.add_argument('--dry-run', action='store_true', help='check the spec and print the number of settings, nothing is simulated')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    for key, value in [('name', args.name), ('workers', args.workers), ('batch_size', args.batch_size), ('backend', args.backend)]:
+        if value is not None:
+            spec[key] = value
+    if args.profile:
+        spec['profile'] = True
+
+    if args.figures and spec.get('experiment') == 'ensemble':
+        raise Exception('Ensemble experiments store no rasters, --figures is not available for them.')
+    cls = experiment_class(spec)
+    kwargs = experiment_kwargs(spec, cls)
+    settings = math.prod(len(values) for values in [*kwargs['params_to_iterate'].values(), *kwargs['params_to_set'].values()])
+    print(cls.__name__ + ': ' + str(settings) + ' settings')
+    if args.dry_run:
+        return 0
+
+    experiment = cls(**build_cache(kwargs))
+    experiment.iterate()
+    print('\nFinished, data in ' + experiment.exp_dir)
+
+    if args.figures:
+        from .ringnet import export_rasters
+        names = export_rasters(path.basename(experiment.exp_dir[:-1]), workers=kwargs.get('workers'))
+        print(str(len(names)) + ' figures in ' + experiment.exp_dir + 'figures/')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,4 +2,6 @@
 # The MIT License
 
 from .experiment import Experiment
-from .weight_matrix_experiment import WeightMatrixExperiment
\ No newline at end of file
+from .weight_matrix_experiment import WeightMatrixExperiment
+from .adaptive_experiment import AdaptiveExperiment
+from .ensemble_experiment import EnsembleExperiment
\ No newline at end of file
@@ -0,0 +1,210 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+from ..ringnet import Parameters
+from ..ringnet import RingNetwork
+from ..ringnet.parameters import activity_shape, activity_dtype
+from ..utils.writer import dump_pickle, load_pickle
+from .weight_matrix_experiment import WeightMatrixExperiment
+import itertools
+import numpy as np
+import os.path as path
+
+'''
+metrics for AdaptiveExperiment, functions of a simulated network returning a number
+'''
+def final_activity(net):
+    # total rate in the last stored time step, 0 once the bump died out
+    return float(np.sum(net.R[:, -1]))
+
+def bump_speed(net):
+    '''
+    mean speed of the bump center in neurons per time step, from the bump_center statistics if
+    the BumpCenter observer ran, otherwise from the stored activity
+    '''
+    N = net.params.N
+    if 'bump_center' in net.statistics:
+        centers = net.statistics['bump_center']
+        times = np.arange(len(centers))
+    else:
+        phase = np.exp(2j * np.pi * net.params.record_index / N)
+        total = np.sum(net.R, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centers = np.where(total > 0, np.angle(phase @ net.R / total) * N / (2 * np.pi) % N, np.nan)
+        times = net.params.record_times[:net.R.shape[1]]
+    valid = ~np.isnan(centers)
+    if np.sum(valid) < 2:
+        return 0.0
+    distance = np.sum(np.diff(np.unwrap(centers[valid] * 2 * np.pi / N))) * N / (2 * np.pi)
+    return float(distance / (times[valid][-1] - times[valid][0]))
+
+METRICS = {'final_activity': final_activity, 'bump_speed': bump_speed}
+
+
+class AdaptiveExperiment(WeightMatrixExperiment):
+    '''
+    sweep that refines the parameter space only where a metric changes
+
+    the parameters in refine (by default all of params_to_iterate, numeric) start from the coarse
+    grid given in params_to_iterate, which splits their space into cells. After every round the
+    metric of each grid point is computed (averaged over the remaining iterated parameters, e.g.
+    seeds) and every cell whose corner values differ by more than tolerance is split at its
+    midpoints, bisection for one parameter and a quadtree for two. New corner points are
+    simulated in the next round, until no cell changes sharply, cells reached max_depth or
+    resolution, or max_settings would be exceeded (the cells with the largest change go first).
+
+    results are stored like a grid sweep: param_space lists every simulated setting and
+    params_to_iterate the values of each parameter that occur, so DataManager loads them as usual.
+    metadata/adaptive.pkl holds the metric of every point and the final cells
+
+        AdaptiveExperiment({'T': [500]}, {'shift_percent': [0, 0.02, 0.04], 'p_inh': [0.2, 0.6, 1]},
+                           metric=bump_speed, tolerance=0.05, max_depth=3)
+    '''
+    def __init__(self, params_to_set=None, params_to_iterate=None, metric=None, refine=None, tolerance=0.1,
+                 max_depth=4, resolution=None, max_settings=None, name='adaptive_exp', **kwargs):
+        if metric is None:
+            raise Exception('AdaptiveExperiment needs a metric, a function of the simulated network returning a number.')
+        self.metric = metric              # net -> number, computed for every simulated setting
+        self.refine = list(params_to_iterate) if refine is None else list(refine)
+        self.tolerance = tolerance        # cells whose corner metrics differ by more than this are split
+        self.max_depth = max_depth        # number of times a coarse cell can be split
+        self.resolution = {} if resolution is None else resolution  # smallest cell width per parameter
+        self.max_settings = max_settings  # budget of simulated settings, None is unlimited
+        self.metric_values = {}           # counter -> metric
+        self.points = {}                  # values of the refined parameters -> counters
+        self.cells = []                   # (((low, high) per refined parameter), depth)
+        for key in self.refine:
+            if key not in params_to_iterate or len(params_to_iterate[key]) < 2:
+                raise Exception("Keyword '" + key + "' cannot be refined. Please give at least two values for it in params_to_iterate.")
+        # the refined values are added to params_to_iterate, the caller's dict stays as it is
+        super().__init__(params_to_set, dict(params_to_iterate), name=name, **kwargs)
+
+    def setup_parameter_space(self):
+        super().setup_parameter_space()
+        self.positions = [self.keys.index(key) for key in self.refine]
+        # the settings of a point are all combinations of the other parameters
+        self.others = list(itertools.product(*[values for key, values in self.parameter_settings.items() if key not in self.refine]))
+        for counter, setting in enumerate(self.param_space):
+            self.points.setdefault(tuple(setting[i] for i in self.positions), []).append(counter)
+        grid = [sorted(set(self.params_to_iterate[key])) for key in self.refine]
+        self.cells = [(cell, 0) for cell in itertools.product(*[list(zip(values[:-1], values[1:])) for values in grid])]
+
+    def settings(self, point):
+        others = [key for key in self.keys if key not in self.refine]
+        settings = []
+        for combination in self.others:
+            values = dict(zip(others, combination))
+            values.update(zip(self.refine, point))
+            settings.append(tuple(values[key] for key in self.keys))
+        return settings
+
+    def write(self, counter, net):
+        # metric from the network in memory, before the writer takes it
+        self.metric_values[counter] = self.metric(net)
+        super().write(counter, net)
+
+    def load_network(self, counter):
+        setting = self.param_space[counter]
+        if self.store is None:
+            return load_pickle(self.sim_dir + str(counter) + '.pkl')
+        net = RingNetwork(Parameters({'keys': self.keys, 'setting': setting}))
+        net._build()
+        net.R = self.store.activity(setting)
+        if path.isfile(self.bump_dir + str(counter) + '.pkl'):
+            net.statistics = load_pickle(self.bump_dir + str(counter) + '.pkl')
+        return net
+
+    def evaluate(self, counters):
+        '''
+        metric of the settings that were not simulated in this process (parallel workers, cache)
+        '''
+        if self.store is not None:
+            self.store.flush()
+        for counter in counters:
+            if counter not in self.metric_values:
+                self.metric_values[counter] = self.metric(self.load_network(counter))
+
+    def value(self, point):
+        return float(np.mean([self.metric_values[counter] for counter in self.points[point]]))
+
+    def variation(self, cell):
+        values = np.array([self.value(corner) for corner in itertools.product(*cell)])
+        if np.all(np.isnan(values)):
+            return 0.0
+        if np.any(np.isnan(values)):
+            return np.inf
+        return np.max(values) - np.min(values)
+
+    def split(self, cell):
+        '''
+        halves of every interval of the cell that is still wider than the resolution, None if none is
+        '''
+        halves = []
+        for key, (low, high) in zip(self.refine, cell):
+            integer = isinstance(low, (int, np.integer)) and isinstance(high, (int, np.integer))
+            middle = (low + high) // 2 if integer else (low + high) / 2
+            if middle in (low, high) or high - low < 2 * self.resolution.get(key, 0):
+                halves.append([(low, high)])
+            else:
+                halves.append([(low, middle), (middle, high)])
+        if all(len(interval) == 1 for interval in halves):
+            return None
+        return list(itertools.product(*halves))
+
+    def refine_cells(self):
+        '''
+        split the cells that change sharply, returns the new points in the order they were found
+        '''
+        candidates = [(self.variation(cell), cell, depth) for cell, depth in self.cells if depth < self.max_depth]
+        candidates = sorted([candidate for candidate in candidates if candidate[0] > self.tolerance], key=lambda candidate: -candidate[0])
+        new_points = []
+        for _, cell, depth in candidates:
+            children = self.split(cell)
+            if children is None:
+                continue
+            points = [point for point in itertools.product(*[sorted(set(itertools.chain(*intervals))) for intervals in zip(*children)])
+                      if point not in self.points and point not in new_points]
+            if self.max_settings is not None and len(self.param_space) + (len(new_points) + len(points)) * len(self.others) > self.max_settings:
+                break
+            new_points += points
+            self.cells.remove((cell, depth))
+            self.cells += [(child, depth + 1) for child in children]
+        return new_points
+
+    def extend(self, points):
+        '''
+        append the settings of the new points to param_space and storage, returns their counters
+        '''
+        start = len(self.param_space)
+        settings = [setting for point in points for setting in self.settings(point)]
+        self.param_space += settings
+        for counter in range(start, len(self.param_space)):
+            self.points.setdefault(tuple(self.param_space[counter][i] for i in self.positions), []).append(counter)
+        for key in self.refine:
+            self.params_to_iterate[key] = sorted(set(point[self.refine.index(key)] for point in self.points))
+        self.save_metadata()
+        if self.store is not None:
+            defaults = Parameters()
+            shapes = [activity_shape(self.keys, setting, defaults) for setting in settings]
+            dtype = np.result_type(*[activity_dtype(self.keys, setting, defaults) for setting in settings])
+            self.store.extend(self.param_space, shapes, dtype)
+        return list(range(start, len(self.param_space)))
+
+    def save_refinement(self):
+        refinement = {'refine': self.refine,
+                      'metric': {point: self.value(point) for point in self.points},
+                      'cells': self.cells,
+                      'tolerance': self.tolerance}
+        dump_pickle(refinement, self.meta_dir + 'adaptive.pkl', fsync=True)
+
+    def _iterate(self):
+        counters = list(range(len(self.param_space)))
+        while True:
+            self.simulate(self.load_cached(counters))
+            self.evaluate(counters)
+            self.save_refinement()
+            points = self.refine_cells()
+            if not points:
+                break
+            print('\rRefining: ' + str(len(points)) + ' new points, ' + str(len(self.param_space)) + ' settings so far', end='')
+            counters = self.extend(points)
@@ -0,0 +1,63 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+from ..utils.writer import dump_pickle
+from .weight_matrix_experiment import WeightMatrixExperiment
+from .parallel import ParallelExecutor, simulate_ensemble, ensemble_to_file
+import os
+
+class EnsembleExperiment(WeightMatrixExperiment):
+    '''
+    sweep in which every parameter setting is simulated for many seeds, only the ensemble
+    summaries are saved
+
+    the seeds of a setting run together as the batch dimension of BatchRunner, batch_size
+    seeds at a time (64 by default), and are reduced to running moments while they run (see ringnet.ensemble):
+    activity, the results of the observers (e.g. bump trajectories) and, with subspace_k, the
+    explained variance ratio of the first principal components. Memory does not grow with the
+    number of seeds and no raster is written. The summary of each setting is saved to
+    ensemble/<counter>.pkl and loaded with DataManager.load_ensemble
+
+        experiment = EnsembleExperiment({'T': [500]}, {'p_inh': [0.5, 1], 'shift_percent': [0.02]},
+                                        seeds=200, batch_size=50, observers=[BumpCenter()])
+        experiment.iterate()
+        summary = DataManager(name).load_ensemble((0.5, 0.02, 500))
+        summary['activity'].mean, summary['statistics']['bump_center'].confidence_interval(0.95)
+    '''
+    def __init__(self, params_to_set=None, params_to_iterate=None, seeds=5, name='ensemble_exp', batch_size=64, workers=None,
+                 chunksize=1, observers=None, activity=True, subspace_k=None, profile=False, compression=None):
+        self.seeds = list(range(seeds)) if isinstance(seeds, int) else list(seeds)
+        self.activity = activity       # keep moments of the activity, off for observer statistics only
+        self.subspace_k = subspace_k   # if set, moments of the explained variance ratio of this many principal components
+        for params in [params_to_set, params_to_iterate]:
+            if params is not None and 'seed' in params:
+                raise Exception("Keyword 'seed' is set by the ensemble. Please give the seeds with the seeds argument.")
+        super().__init__(params_to_set, params_to_iterate, name=name, batch_size=batch_size, workers=workers, chunksize=chunksize,
+                         observers=observers, record=False, profile=profile, queue_size=0, compression=compression)
+
+    def setup_file_structure(self):
+        super().setup_file_structure()
+        self.ens_dir = self.exp_dir + 'ensemble/'
+        if not os.path.isdir(self.ens_dir):
+            os.mkdir(self.ens_dir)
+            print('Created ' + self.ens_dir)
+
+    def save_metadata(self):
+        super().save_metadata()
+        dump_pickle(self.seeds, self.meta_dir + 'seeds.pkl')
+
+    def simulate(self, pending):
+        if self.workers is not None:
+            executor = ParallelExecutor(self.workers, self.chunksize)
+            done = 0
+            for indices, _ in executor.map(ensemble_to_file, self.keys, self.param_space, self.seeds, self.batch_size,
+                                           self.observers, self.activity, self.subspace_k, self.ens_dir, self.compression,
+                                           pending=pending):
+                done += len(indices)
+                print('\rFinished ' + str(done) + ' of ' + str(len(pending)) + ' settings', end='')
+        else:
+            for counter in pending:
+                setting = self.param_space[counter]
+                print('\rCurrent setting: ' + str(self.keys) + str(setting) + ', ' + str(len(self.seeds)) + ' seeds', end='')
+                summary = simulate_ensemble(self.keys, setting, self.seeds, self.batch_size, self.observers, self.activity, self.subspace_k)
+                dump_pickle(summary, self.ens_dir + str(counter) + '.pkl', self.compression, fsync=True)
@@ -3,18 +3,38 @@
 
 from ..ringnet import Parameters
 from ..ringnet import RingNetwork
-from ..ringnet import Plot
+from ..ringnet import BatchRunner
+from ..ringnet.parameters import activity_shape, activity_dtype
+from .parallel import ParallelExecutor
+from ..utils.profile import Profiler
 import itertools
+import copy
 
 class Experiment:
-    def __init__(self, params_to_set=None, params_to_iterate=None):
+    def __init__(self, params_to_set=None, params_to_iterate=None, batch_size=None, workers=None, chunksize=1,
+                 observers=None, record=None, cache=None, profile=False):
         self.params_to_set = params_to_set
         self.params_to_iterate = params_to_iterate
+        self.batch_size = batch_size   # if set, compatible settings are simulated together in batches of this size
+        self.workers = workers         # if set, settings are simulated in a process pool with this many workers
+        self.chunksize = chunksize     # number of settings sent to a worker at once
+        self.observers = observers     # observer templates, each setting gets its own copy, see ringnet.observers
+        self.record = record if record is not None else not observers  # keep full rasters, by default only when no observers are given
+        self.cache = cache             # utils.ResultCache, settings computed before are loaded instead of simulated
+        self.profiler = Profiler() if profile else None  # timings and counters of iterate, see utils.profile
         self.parameter_settings = {}
         self.parameter_log = {}
         self.activity = {}
+        self.statistics = {}
         
     def iterate(self):
+        if self.profiler is not None:
+            with self.profiler:
+                self._iterate()
+        else:
+            self._iterate()
+        
+    def _iterate(self):
         
         # combine all parameter settings into one dict
         self.parameter_settings.update(self.params_to_iterate)
@@ -24,7 +44,36 @@ class Experiment:
         self.param_space = list(itertools.product(*self.parameter_settings.values()))
         self.keys = [*self.parameter_settings.keys()]
         
-        for setting in self.param_space:
+        pending = self.load_cached()
+        
+        if self.workers is not None:
+            self.iterate_parallel(pending)
+        elif self.batch_size is not None:
+            self.iterate_batched(pending)
+        else:
+            self.iterate_serial(pending)
+    
+    def load_cached(self):
+        '''
+        fill in every setting found in the cache, returns the indices of the settings left to simulate
+        '''
+        if self.cache is None:
+            return list(range(len(self.param_space)))
+        
+        options = self.cache.options(self.observers, self.record)
+        pending = []
+        for index, setting in enumerate(self.param_space):
+            parameters = Parameters({'keys': self.keys, 'setting': setting})
+            result = self.cache.get(self.cache.key(parameters, options))
+            if result is None:
+                pending.append(index)
+            else:
+                self.store(setting, parameters, result['R'], result['statistics'], cached=True)
+        return pending
+    
+    def iterate_serial(self, pending):
+        for index in pending:
+            setting = self.param_space[index]
             
             params_to_update = {'keys':     self.keys, 
                                 'setting':  setting}
@@ -33,11 +82,46 @@ class Experiment:
             
             parameters = Parameters(params_to_update)
             net = RingNetwork(parameters)
-            net.run()
+            net.run(copy.deepcopy(self.observers), self.record)
             
             #plot = Plot()
             #plot.activity_raster(net.R)
             
-            self.parameter_log[setting] = parameters
-            self.activity[setting] = net.R 
-        
\ No newline at end of file
+            self.store(setting, parameters, net.R, net.statistics)
+    
+    def store(self, setting, parameters, R, statistics, cached=False):
+        self.parameter_log[setting] = parameters
+        if R is not None:
+            self.activity[setting] = R
+        if statistics:
+            self.statistics[setting] = statistics
+        if self.cache is not None and not cached:
+            key = self.cache.key(parameters, self.cache.options(self.observers, self.record))
+            self.cache.put(key, {'R': R, 'statistics': statistics})
+    
+    def iterate_batched(self, pending):
+        networks = [RingNetwork(Parameters({'keys': self.keys, 'setting': self.param_space[index]})) for index in pending]
+        runner = BatchRunner(networks, self.batch_size)
+        
+        for indices, batch in runner.iter_batches(self.observers, self.record):
+            for index, net in zip(indices, batch):
+                setting = self.param_space[pending[index]]
+                
+                print('\rCurrent setting: ' + str(self.keys) + str(setting), end='')
+                
+                self.store(setting, net.params, net.R, net.statistics)
+    
+    def iterate_parallel(self, pending):
+        # activity shape of every setting, needed to lay out the shared memory block
+        record = self.record
+        defaults = Parameters()
+        settings = [self.param_space[index] for index in pending]
+        shapes = [activity_shape(self.keys, setting, defaults) if record else (0, 0) for setting in settings]
+        dtypes = [activity_dtype(self.keys, setting, defaults) for setting in settings]
+        
+        print('\rRunning ' + str(len(settings)) + ' settings on ' + str(self.workers) + ' workers', end='')
+        
+        executor = ParallelExecutor(self.workers, self.chunksize)
+        for index, params, R, statistics in executor.iter_in_memory(self.keys, settings, shapes, self.batch_size,
+                                                                    self.observers, record, dtypes):
+            self.store(settings[index], params, R if record else None, statistics)
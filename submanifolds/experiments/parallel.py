@@ -0,0 +1,150 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+from ..ringnet import Parameters
+from ..ringnet import RingNetwork
+from ..ringnet import BatchRunner
+from ..ringnet import Ensemble
+from ..utils.store import ArrayStore
+from ..utils import profile
+from ..utils.profile import Profiler
+from ..utils.writer import dump_pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import copy
+import numpy as np
+
+'''
+worker functions, module level so they can be sent to the process pool. Each setting builds
+its own Parameters (with its own random number generator) and network, so results do not
+depend on the number of workers or the order in which chunks are scheduled
+'''
+def simulate(keys, settings, batch_size=None, observers=None, record=False):
+    networks = [RingNetwork(Parameters({'keys': keys, 'setting': setting})) for setting in settings]
+    if batch_size is None:
+        for net in networks:
+            net.run(copy.deepcopy(observers), record)
+    else:
+        BatchRunner(networks, batch_size).run(observers, record)
+    return networks
+
+def simulate_to_shared_memory(keys, indices, settings, batch_size, observers, record, shm_name, offsets):
+    # activity is written straight into the parent's shared block instead of being pickled back,
+    # only parameters, the (small) observer statistics and the number of stored time steps
+    # (fewer than the layout if an adaptive run stopped early) are returned
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        results = []
+        for index, net in zip(indices, simulate(keys, settings, batch_size, observers, record)):
+            if net.R is not None:
+                with profile.phase('transfer'):
+                    # offsets are in bytes, the block holds each activity in its own dtype
+                    region = np.ndarray(net.R.shape, dtype=net.R.dtype, buffer=shm.buf, offset=offsets[index])
+                    region[...] = net.R
+                    del region
+            results.append((net.params, net.statistics, 0 if net.R is None else net.R.shape[1]))
+    finally:
+        shm.close()
+    return indices, results
+
+def cache_result(cache, net, observers, record):
+    if cache is not None:
+        cache.put(cache.key(net.params, cache.options(observers, record)), {'R': net.R, 'statistics': net.statistics})
+
+def simulate_to_file(keys, indices, settings, batch_size, observers, record, sim_dir, bump_dir, cache=None, compression=None):
+    # each worker writes its own networks (and cache entries), nothing large travels back to the parent
+    for index, net in zip(indices, simulate(keys, settings, batch_size, observers, record)):
+        with profile.phase('save'):
+            dump_pickle(net, sim_dir + str(index) + '.pkl', compression, fsync=True)
+            if net.statistics:
+                dump_pickle(net.statistics, bump_dir + str(index) + '.pkl', compression, fsync=True)
+        cache_result(cache, net, observers, record)
+    return indices, None
+
+def simulate_to_store(keys, indices, settings, batch_size, observers, record, sim_dir, bump_dir, cache=None, compression=None):
+    # rows of the preallocated array files are disjoint, so workers write to them concurrently
+    store = ArrayStore(sim_dir).open()
+    for index, net in zip(indices, simulate(keys, settings, batch_size, observers, record)):
+        with profile.phase('save'):
+            if net.R is not None:
+                store.write(index, net.R)
+            if net.statistics:
+                dump_pickle(net.statistics, bump_dir + str(index) + '.pkl', compression, fsync=True)
+        cache_result(cache, net, observers, record)
+    store.flush()
+    return indices, None
+
+def simulate_ensemble(keys, setting, seeds, batch_size=64, observers=None, activity=True, subspace_k=None):
+    # networks are created one batch at a time by the generator, see Ensemble.run
+    networks = (RingNetwork(Parameters({'keys': list(keys) + ['seed'], 'setting': tuple(setting) + (seed,)})) for seed in seeds)
+    return Ensemble(activity, subspace_k).run(networks, batch_size, observers).summary()
+
+def ensemble_to_file(keys, indices, settings, seeds, batch_size, observers, activity, subspace_k, ens_dir, compression=None):
+    for index, setting in zip(indices, settings):
+        summary = simulate_ensemble(keys, setting, seeds, batch_size, observers, activity, subspace_k)
+        with profile.phase('save'):
+            dump_pickle(summary, ens_dir + str(index) + '.pkl', compression, fsync=True)
+    return indices, None
+
+def profiled(function, *args):
+    # runs a worker function under its own profiler, the parent merges it into the active one
+    with Profiler() as profiler:
+        result = function(*args)
+    return result, profiler
+
+
+class ParallelExecutor:
+    '''
+    distributes the settings of a sweep over a process pool in chunks of chunksize settings
+    '''
+    def __init__(self, workers=None, chunksize=1):
+        self.workers = workers        # number of processes, None uses all cores
+        self.chunksize = chunksize    # settings per task, larger chunks amortize scheduling and batch better
+
+    def chunks(self, indices):
+        return [indices[i:i+self.chunksize] for i in range(0, len(indices), self.chunksize)]
+
+    def map(self, function, keys, param_space, *args, pending=None):
+        '''
+        yields (indices, result) for each chunk as soon as it finishes, pending restricts
+        the run to these indices of param_space. While a profiler is active the workers record
+        their own timings, which are merged into it
+        '''
+        pending = list(range(len(param_space))) if pending is None else list(pending)
+        parent = profile.active()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            if parent is None:
+                futures = [pool.submit(function, keys, chunk, [param_space[i] for i in chunk], *args)
+                           for chunk in self.chunks(pending)]
+            else:
+                futures = [pool.submit(profiled, function, keys, chunk, [param_space[i] for i in chunk], *args)
+                           for chunk in self.chunks(pending)]
+            for future in as_completed(futures):
+                if parent is None:
+                    yield future.result()
+                else:
+                    result, profiler = future.result()
+                    parent.merge(profiler)
+                    yield result
+
+    def iter_in_memory(self, keys, param_space, shapes, batch_size=None, observers=None, record=False, dtypes=None):
+        '''
+        simulate all settings, yields index, parameters, (N, T) activity and statistics of each
+        setting as soon as the chunk it belongs to has finished. dtypes are those of the activity
+        (params.dtype), float64 by default
+        '''
+        dtypes = [np.dtype(np.float64)] * len(shapes) if dtypes is None else [np.dtype(dtype) for dtype in dtypes]
+        # byte offsets, every activity starts 8-byte aligned
+        sizes = [-(-N * T * dtype.itemsize // 8) * 8 for (N, T), dtype in zip(shapes, dtypes)]
+        offsets = [int(offset) for offset in np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))]
+        shm = shared_memory.SharedMemory(create=True, size=max(offsets[-1], 1))
+        try:
+            for indices, results in self.map(simulate_to_shared_memory, keys, param_space,
+                                             batch_size, observers, record, shm.name, offsets):
+                for index, (params, statistics, columns) in zip(indices, results):
+                    # copy out of the shared block so it can be released
+                    R = np.ndarray((shapes[index][0], columns), dtype=dtypes[index], buffer=shm.buf, offset=offsets[index]).copy()
+                    yield index, params, R, statistics
+        finally:
+            shm.close()
+            shm.unlink()
@@ -3,21 +3,43 @@
 
 from ..ringnet import Parameters
 from ..ringnet import RingNetwork
-from ..ringnet import Plot
+from ..ringnet import BatchRunner
+from ..ringnet.parameters import activity_shape, activity_dtype
+from ..utils.store import ArrayStore
+from ..utils import profile
+from ..utils.profile import Profiler
+from ..utils.writer import BackgroundWriter, dump_pickle
+from ..utils.get_root import get_root
+from .parallel import ParallelExecutor, simulate_to_file, simulate_to_store
 import itertools
+import copy
+import contextlib
 import _pickle as cPickle
+import numpy as np
 from datetime import datetime
 import os
-import os.path as path
 
 class WeightMatrixExperiment:
-    def __init__(self, params_to_set=None, params_to_iterate=None, name='weight_matrix_exp'):
+    def __init__(self, params_to_set=None, params_to_iterate=None, name='weight_matrix_exp', batch_size=None, workers=None, chunksize=1,
+                 observers=None, record=None, backend='pickle', cache=None, profile=False, queue_size=8, compression=None):
         self.params_to_set = params_to_set
         self.params_to_iterate = params_to_iterate
+        self.batch_size = batch_size   # if set, compatible settings are simulated together in batches of this size
+        self.workers = workers         # if set, settings are simulated in a process pool with this many workers
+        self.chunksize = chunksize     # number of settings sent to a worker at once
+        self.observers = observers     # observer templates, statistics of each setting are saved to bump_statistics/
+        self.record = record if record is not None else not observers  # save full rasters, by default only when no observers are given
+        self.backend = backend         # 'pickle', one pickled network per setting, or 'array', see utils.store
+        self.store = None
+        self.cache = cache             # utils.ResultCache, settings computed before are copied instead of simulated
+        self.profiler = Profiler() if profile else None  # timings and counters of iterate, saved to metadata/profile.json
+        self.queue_size = queue_size   # networks waiting for the background writer, 0 writes synchronously, see utils.writer
+        self.compression = compression # None, 'gzip' or 'lzma' for the pickled networks and statistics
+        self.writer = None
         self.parameter_settings = {}
         self.datestamp = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
         self.name = name
-        self.root = path.abspath(path.join(__file__ ,"../../../..")) + '/'
+        self.root = get_root()
         self.exp_dir = self.root + 'data/' + self.name + '_' + self.datestamp + '/'
         self.meta_dir = self.exp_dir + 'metadata/'
         self.sim_dir = self.exp_dir + 'simulation/'
@@ -65,17 +87,111 @@ class WeightMatrixExperiment:
         with open(self.meta_dir + 'keys.pkl', "wb") as f:
             cPickle.dump(self.keys, f)
         
+    def setup_store(self):
+        if self.backend == 'array':
+            defaults = Parameters()
+            shapes = [activity_shape(self.keys, setting, defaults) for setting in self.param_space]
+            dtype = np.result_type(*[activity_dtype(self.keys, setting, defaults) for setting in self.param_space])
+            self.store = ArrayStore(self.sim_dir).create(self.keys, self.param_space, shapes, dtype)
+        elif self.backend != 'pickle':
+            raise Exception("Keyword '" + str(self.backend) + "' is not a valid storage backend. Please choose 'pickle' or 'array'.")
+        
     def save_data(self, counter, net):
-        with open(self.sim_dir + str(counter) + '.pkl', "wb") as f:
-            cPickle.dump(net, f)
+        with profile.phase('save'):
+            if self.store is not None:
+                if net.R is not None:
+                    self.store.write(counter, net.R)
+            else:
+                dump_pickle(net, self.sim_dir + str(counter) + '.pkl', self.compression, fsync=True)
+            if net.statistics:
+                self.save_statistics(counter, net.statistics)
+            
+    def save_statistics(self, counter, statistics):
+        dump_pickle(statistics, self.bump_dir + str(counter) + '.pkl', self.compression, fsync=True)
+    
+    def write(self, counter, net):
+        '''
+        save_data and cache_data on the background writer, the next setting is simulated meanwhile
+        '''
+        if self.writer is None:
+            self.save_data(counter, net)
+            self.cache_data(net)
+        else:
+            # the job keeps its own reference to the activity, the loop may release net.R before it runs
+            net = copy.copy(net)
+            self.writer.submit(self.save_data, counter, net, directories=[self.sim_dir, self.bump_dir])
+            self.writer.submit(self.cache_data, net)
             
     def setup(self):
         self.setup_file_structure()
         self.setup_parameter_space()
         self.save_metadata()
+        self.setup_store()
+        
+    def cache_data(self, net):
+        if self.cache is not None:
+            key = self.cache.key(net.params, self.cache.options(self.observers, self.record))
+            self.cache.put(key, {'R': net.R, 'statistics': net.statistics})
+        
+    def load_cached(self, counters=None):
+        '''
+        write every setting found in the cache into this experiment, returns the counters left to simulate.
+        counters restricts the lookup to these settings, by default all of param_space
+        '''
+        counters = list(range(len(self.param_space))) if counters is None else list(counters)
+        if self.cache is None:
+            return counters
+        
+        options = self.cache.options(self.observers, self.record)
+        pending = []
+        for counter in counters:
+            setting = self.param_space[counter]
+            net = RingNetwork(Parameters({'keys': self.keys, 'setting': setting}))
+            result = self.cache.get(self.cache.key(net.params, options))
+            if result is None:
+                pending.append(counter)
+            else:
+                net._build()
+                net.R = result['R']
+                net.statistics = result['statistics']
+                self.save_data(counter, net)
+        return pending
         
     def iterate(self):
-        for counter, setting in enumerate(self.param_space):
+        if self.profiler is not None:
+            with self.profiler:
+                self._iterate()
+            self.profiler.to_json(self.meta_dir + 'profile.json')
+        else:
+            self._iterate()
+        
+    def _iterate(self):
+        self.simulate(self.load_cached())
+        
+    def simulate(self, pending):
+        '''
+        simulate and save the settings with counters in pending
+        '''
+        # workers of the parallel path write themselves
+        if self.queue_size and self.workers is None:
+            self.writer = BackgroundWriter(self.queue_size, self.compression)
+        try:
+            # leaving the writer waits for every queued write, also when the simulation raised
+            with self.writer if self.writer is not None else contextlib.nullcontext():
+                if self.workers is not None:
+                    self.iterate_parallel(pending)
+                elif self.batch_size is not None:
+                    self.iterate_batched(pending)
+                else:
+                    self.iterate_serial(pending)
+        finally:
+            self.writer = None
+            if self.store is not None:
+                self.store.flush()
+        
+    def iterate_serial(self, pending):
+        for counter in pending:
+            setting = self.param_space[counter]
             
             params_to_update = {'keys':     self.keys, 
                                 'setting':  setting}
@@ -84,7 +200,31 @@ class WeightMatrixExperiment:
             
             parameters = Parameters(params_to_update)
             net = RingNetwork(parameters)
-            net.run()
+            net.run(copy.deepcopy(self.observers), self.record)
             
-            self.save_data(counter, net)
-        
\ No newline at end of file
+            self.write(counter, net)
+    
+    def iterate_batched(self, pending):
+        networks = [RingNetwork(Parameters({'keys': self.keys, 'setting': self.param_space[counter]})) for counter in pending]
+        runner = BatchRunner(networks, self.batch_size)
+        
+        for indices, batch in runner.iter_batches(self.observers, self.record):
+            for index, net in zip(indices, batch):
+                counter = pending[index]
+                
+                print('\rCurrent setting: ' + str(self.keys) + str(self.param_space[counter]), end='')
+                
+                self.write(counter, net)
+                
+                # activity is with the writer, release it before the next batch
+                net.R = None
+    
+    def iterate_parallel(self, pending):
+        executor = ParallelExecutor(self.workers, self.chunksize)
+        worker = simulate_to_store if self.store is not None else simulate_to_file
+        done = 0
+        for indices, _ in executor.map(worker, self.keys, self.param_space, self.batch_size, self.observers,
+                                       self.record, self.sim_dir, self.bump_dir, self.cache, self.compression,
+                                       pending=pending):
+            done += len(indices)
+            print('\rFinished ' + str(done) + ' of ' + str(len(pending)) + ' settings', end='')
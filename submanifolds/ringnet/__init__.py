@@ -4,4 +4,14 @@
 from .network import RingNetwork
 from .parameters import Parameters
 from .analysis import Analysis
-from .plot import Plot
\ No newline at end of file
+from .operator import CirculantOperator
+from .batch import BatchRunner
+from .observers import Observer, BumpCenter, BumpWidth, PeakRate, TotalActivity, DecimatedRaster
+from .ensemble import Ensemble, RunningMoments
+
+def __getattr__(name):
+    # plotting imports matplotlib, which simulation-only processes never need
+    if name in ('Plot', 'export_rasters'):
+        from . import plot
+        return getattr(plot, name)
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
\ No newline at end of file
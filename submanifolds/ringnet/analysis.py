@@ -4,32 +4,90 @@
 import os
 import os.path as path
 import _pickle as cPickle
+import numpy as np
+from .parameters import Parameters
+from .network import RingNetwork
+from . import spectrum
+from . import subspace
+from ..utils.load import DataManager
 
 class Analysis:
     def __init__(self, exp_data_dir):
-        pass
-        #self.root = path.abspath(path.join(__file__ ,"../../../..")) + '/'
-        #self.data_dir = self.root + 'data/'
-        #self.exp_dir = self.data_dir + exp_data_dir
-        #self.param_space = self.load_metadata()
-    # eigenvalue spectrum, real-imag
-    # eigenvalue magnitudes
-    # first K eigenvectors, real-imag
-    # dominant frequency of eigenvectors
-    
-    # pca
-    # explained variance
-    # principal angles
-    
+        self.manager = DataManager(exp_data_dir)
+        self.exp_dir = self.manager.exp_dir
+        self.eig_dir = self.manager.eig_dir
+        self.param_space = self.manager.param_space
+        self.keys = self.manager.keys
+        self.pcs = {}
+        
     # plots
     # single neurons
     # pca 2d projection
     
-    #def load_metadata(self):
-    #    name = self.exp_dir + 'param_space.pkl'
-    #    with open(name, "rb") as f:
-    #        return cPickle.load(f)
+    def network(self, parameter_setting):
+        # connectivity and inputs only depend on the parameters, no need to load the simulation
+        net = RingNetwork(Parameters({'keys': self.keys, 'setting': parameter_setting}))
+        net._build()
+        return net
     
-    #def load_data(self):
-        
-        
\ No newline at end of file
+    def eigendecomposition(self, k=10, recompute=False):
+        '''
+        eigenvalue spectrum, first k eigenvectors and their dominant frequencies for every
+        setting in the sweep, cached in eigendecomposition/<counter>.pkl
+
+        settings with global inhibition that share a kernel share one FFT, settings with
+        selective inhibition are solved on their active subset, see ringnet.spectrum
+        '''
+        results = {}
+        circulant = {}
+        for counter, setting in enumerate(self.param_space):
+            name = self.eig_dir + str(counter) + '.pkl'
+            if path.isfile(name) and not recompute:
+                with open(name, "rb") as f:
+                    result = cPickle.load(f)
+                if result['k'] == k:
+                    results[setting] = result
+                    continue
+            
+            print('\rEigendecomposition: ' + str(self.keys) + str(setting), end='')
+            
+            net = self.network(setting)
+            if net.weights is not None and np.all(np.asarray(net.P) == 1):
+                key = net.weights.tobytes()
+                if key not in circulant:
+                    circulant[key] = spectrum.circulant_spectrum(net.weights, k)
+                result = dict(circulant[key])
+            else:
+                result = spectrum.spectrum(net, k)
+            result['k'] = k
+            
+            with open(name, "wb") as f:
+                cPickle.dump(result, f)
+            results[setting] = result
+        return results
+    
+    def pca(self, k=10, settings=None, chunk=None):
+        '''
+        principal components and explained variance of the activity of each setting, computed
+        once per setting and kept, so comparisons between settings reuse the same bases
+        '''
+        settings = self.param_space if settings is None else settings
+        for setting in settings:
+            if setting in self.pcs and self.pcs[setting]['components'].shape[1] >= k:
+                continue
+            
+            print('\rPCA: ' + str(self.keys) + str(setting), end='')
+            
+            R = self.manager.load_activity(setting)
+            self.pcs[setting] = subspace.pca(R, k, chunk)
+        return {setting: self.pcs[setting] for setting in settings}
+    
+    def principal_angles(self, k=10, settings=None, chunk=None):
+        '''
+        principal angles between the k-dimensional pca subspaces of all pairs of settings,
+        returns an (S, S, k) array ordered like settings
+        '''
+        settings = self.param_space if settings is None else settings
+        pcs = self.pca(k, settings, chunk)
+        bases = np.stack([pcs[setting]['components'][:, :k] for setting in settings])
+        return subspace.principal_angles(bases)
@@ -0,0 +1,141 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+import copy
+from ..utils import profile
+
+class BatchRunner:
+    '''
+    runs many networks together, settings that share N, T, the engine, precision, recording
+    layout and the recurrent kernel are stacked into an N x B rate matrix and advanced with one matrix-matrix
+    product (or one batched FFT) per time step instead of B matrix-vector products
+
+    each network still gets its own activity in net.R, identical to net.run(), and
+    its own copies of the observers, results in net.statistics
+    '''
+    def __init__(self, networks, batch_size=None):
+        self.networks = list(networks)
+        self.batch_size = batch_size
+
+    def _group_key(self, net):
+        p = net.params
+        # networks with the same connectivity parameters share the weights and the recurrent product,
+        # nothing is built here, the weights of a batch are built when it runs
+        kernel = net._connectivity_key()
+        recording = (p.record_times.tobytes(), p.record_index.tobytes(), p.record_neurons is None)
+        return (p.N, p.T, p.engine, p.adaptive, p.fast_forward, np.dtype(p.dtype).str, recording, kernel)
+
+    def groups(self):
+        '''
+        indices of compatible networks, split into batches of at most batch_size
+        '''
+        groups = {}
+        for index, net in enumerate(self.networks):
+            groups.setdefault(self._group_key(net), []).append(index)
+
+        batches = []
+        for indices in groups.values():
+            size = len(indices) if self.batch_size is None else self.batch_size
+            batches += [indices[i:i+size] for i in range(0, len(indices), size)]
+        return batches
+
+    def iter_batches(self, observers=None, record=False, ensemble=None):
+        '''
+        run batch after batch, yields the indices and networks of each finished batch
+
+        observers are templates, every network gets its own deep copy, record works as in RingNetwork.run.
+        ensemble (see ensemble.py) sees the N x B rates of the batch at every step
+        '''
+        observers = [] if observers is None else list(observers)
+
+        for indices in self.groups():
+            networks = [self.networks[i] for i in indices]
+            self._run_batch(networks, observers, record, ensemble)
+            yield indices, networks
+
+    def run(self, observers=None, record=False, ensemble=None):
+        for _ in self.iter_batches(observers, record, ensemble):
+            pass
+        return self.networks
+
+    def _build(self, networks):
+        # the weights are built once per batch and shared by its networks
+        reference = networks[0]
+        if reference._built == False:
+            reference._build()
+        for net in networks[1:]:
+            if net._built == False:
+                net._build_like(reference)
+
+    def _run_batch(self, networks, observers, record, ensemble=None):
+        reference = networks[0]
+        self._build(networks)
+
+        if reference.params.adaptive or reference.params.fast_forward:
+            # each setting stops (or is rectified) at its own steps, these runs are not batched
+            for net in networks:
+                if ensemble is None:
+                    net.run(copy.deepcopy(observers), record)
+                else:
+                    net.run(copy.deepcopy(observers) + [ensemble.observer()], record)
+                    del net.statistics[ensemble.observer().name]
+            return
+
+        with profile.phase('run_batch'):
+            self._simulate_batch(networks, observers, record, ensemble)
+        profile.count('steps', reference.params.T * len(networks))
+
+    def _simulate_batch(self, networks, observers, record, ensemble=None):
+        reference = networks[0]
+
+        params = reference.params
+        N, T, B = params.N, params.T, len(networks)
+        dtype = np.dtype(params.dtype)
+
+        # recurrent kernel is shared by the whole batch
+        recurrent = reference._recurrent(dtype)
+
+        # stack everything that differs between settings column by column
+        column = lambda value: np.broadcast_to(value, (N,))
+        P = np.column_stack([column(net.P) for net in networks]).astype(dtype)
+        drive = np.column_stack([column(net.I_E - net.I_I) for net in networks]).astype(dtype)
+        r = np.column_stack([column(net.params.initial_r) for net in networks]).astype(dtype)
+        r_next = np.empty_like(r)
+
+        # recording layout is the same for the whole batch, see _group_key
+        columns = np.full(T, -1)
+        columns[params.record_times] = np.arange(len(params.record_times))
+        neurons = slice(None) if params.record_neurons is None else params.record_index
+
+        # (B, neurons, times) so that each network's activity is a contiguous block
+        r_store = np.zeros((B, len(params.record_index), len(params.record_times)), dtype=dtype) if record else None
+
+        batch_observers = [copy.deepcopy(observers) for net in networks]
+        for net, net_observers in zip(networks, batch_observers):
+            for observer in net_observers:
+                observer.start(net)
+        if ensemble is not None:
+            ensemble.start(reference)
+
+        counting = profile.active() is not None
+        for t in range(T):
+            if r_store is not None and columns[t] >= 0:
+                r_store[:, :, columns[t]] = r[neurons].T
+            for b, net_observers in enumerate(batch_observers):
+                for observer in net_observers:
+                    observer.update(t, r[:, b])
+            if ensemble is not None:
+                ensemble.update(t, r)
+            recurrent(r, out=r_next)
+            r_next += drive
+            r_next *= P
+            if counting:
+                profile.count('rectified', np.count_nonzero(r_next < 0))
+            np.maximum(r_next, 0, out=r_next)
+            r, r_next = r_next, r
+
+        for b, net in enumerate(networks):
+            net.R = r_store[b] if record else None
+            net.statistics = {observer.name: observer.result() for observer in batch_observers[b]}
+            net._after_run()
@@ -0,0 +1,101 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+'''
+heterogeneous connectivity for params.connectivity = 'sparse'
+
+every presynaptic neuron i has its own kernel centre i + shifts[i] and width sigmas[i], so W is
+no longer circulant. The weights split into the excitatory gaussian part, which is local and is
+stored as a sparse (CSC) matrix E (optionally cut off at a distance and randomly thinned), and the
+global inhibition -w_I, the same for all pairs, which is a rank-1 term:
+
+    W @ r = weight_factor * (E @ r - w_I * sum(r))
+
+memory is proportional to the number of excitatory synapses, the inhibition costs one sum per step.
+The cutoff keeps that number at about 2 * cutoff * sigma per neuron, cutoff=None keeps all N^2.
+Without jitter and thinning and with cutoff=None W equals the dense circulant matrix
+'''
+
+def sparse_excitation(N, shifts, sigmas, w_E, weight_factor, cutoff=4, p_connect=1, seed=0):
+    '''
+    excitatory weights as a scipy CSC matrix, E[j, i] = weight_factor * w_E * exp(-dx^2 / (2 sigmas[i]^2))
+    with dx the distance on the ring between neuron j and the kernel centre of neuron i.
+    Columns are the presynaptic neurons, so each block of columns is written once, in order
+    '''
+    from scipy import sparse
+
+    # candidate postsynaptic neurons per column: a band around the kernel centre
+    centres = (np.arange(N) + shifts) % N
+    if cutoff is None:
+        width = N
+    else:
+        width = min(N, 2 * int(np.ceil(cutoff * np.max(sigmas))) + 3)
+    offsets = np.arange(width) - width // 2
+    index_dtype = np.int32 if N < 2**31 else np.int64
+
+    indices = []
+    data = []
+    counts = np.zeros(N, dtype=np.int64)
+    # a block of presynaptic neurons at a time keeps the temporary arrays at block * width entries
+    block = max(1, 2**22 // width)
+    rng = np.random.RandomState([seed, 2])
+    for start in range(0, N, block):
+        i = np.arange(start, min(start + block, N))
+        j = (np.round(centres[i])[:, None] + offsets[None, :]).astype(np.int64) % N
+
+        # same distance as the circulant kernel: from (j - i) % N to the shift, the shorter way round
+        d = np.abs((j - i[:, None]) % N - shifts[i, None] % N)
+        dx = np.minimum(d, N - d)
+        keep = np.ones(dx.shape, dtype=bool) if cutoff is None else dx <= cutoff * sigmas[i, None]
+        if p_connect < 1:
+            keep &= rng.random_sample(dx.shape) < p_connect
+
+        # row-major selection keeps the entries grouped by column
+        counts[i] = np.sum(keep, axis=1)
+        indices.append(j[keep].astype(index_dtype))
+        data.append(weight_factor * w_E * np.exp(-0.5 * dx[keep]**2 / np.broadcast_to(sigmas[i, None], dx.shape)[keep]**2))
+
+    indptr = np.concatenate(([0], np.cumsum(counts))).astype(index_dtype)
+    E = sparse.csc_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=(N, N))
+    E.sort_indices()
+    return E
+
+
+class SparseOperator:
+    '''
+    recurrent weights as sparse excitation plus rank-1 inhibition, W = E - inhibition * ones ones^T
+    '''
+    def __init__(self, E, inhibition):
+        self.E = E
+        self.inhibition = inhibition
+        self.N = E.shape[0]
+        self.shape = E.shape
+        self.dtype = E.dtype
+
+    def astype(self, dtype):
+        return SparseOperator(self.E.astype(dtype), self.inhibition)
+
+    def matmat(self, X, out=None):
+        # works for vectors and (N, B) matrices of rates
+        X = np.asarray(X)
+        if out is None:
+            out = np.empty(X.shape, dtype=np.result_type(self.dtype, X.dtype))
+        out[...] = self.E @ X
+        out -= self.inhibition * np.sum(X, axis=0)
+        return out
+
+    def matvec(self, x):
+        return self.matmat(np.ravel(x))
+
+    def __matmul__(self, x):
+        return self.matmat(x)
+
+    @property
+    def nnz(self):
+        return self.E.nnz
+
+    def toarray(self):
+        # materialize the dense matrix, only meant for small N
+        return self.E.toarray() - self.inhibition
@@ -0,0 +1,182 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+import itertools
+from .observers import Observer
+from .subspace import pca
+
+'''
+statistics across an ensemble of networks that differ only in their random seed
+
+the networks of an ensemble are simulated together by BatchRunner (seeds as the batch
+dimension) and every quantity is reduced to running moments as it is produced, so no
+individual raster has to be kept. Moments are merged with the parallel form of Welford's
+algorithm (Chan, Golub, LeVeque), which stays accurate for hundreds of samples
+'''
+
+class RunningMoments:
+    '''
+    count, mean and sum of squared deviations (M2) of samples of an array of the given shape
+
+    every entry has its own count, add can update a part of the array (index) and skips nan
+    samples, e.g. the bump center of a network whose activity died out
+    '''
+    def __init__(self, shape=()):
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.M2 = np.zeros(shape)
+
+    def add(self, samples, index=Ellipsis):
+        '''
+        samples has the samples along its first axis, each of the shape of self.mean[index]
+        '''
+        samples = np.asarray(samples, dtype=np.float64)
+        valid = ~np.isnan(samples)
+        count = np.sum(valid, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.nansum(samples, axis=0) / count, 0)
+        M2 = np.nansum((samples - mean)**2, axis=0)
+        self._combine(count, mean, M2, index)
+
+    def merge(self, other):
+        # moments of the union of both sample sets
+        self._combine(other.count, other.mean, other.M2, Ellipsis)
+        return self
+
+    def _combine(self, count, mean, M2, index):
+        total = self.count[index] + count
+        weight = np.divide(count, total, out=np.zeros(np.shape(total)), where=total > 0)
+        delta = mean - self.mean[index]
+        self.mean[index] = self.mean[index] + delta * weight
+        self.M2[index] = self.M2[index] + M2 + delta**2 * self.count[index] * weight
+        self.count[index] = total
+
+    @property
+    def variance(self):
+        # unbiased, nan where there are less than two samples
+        return np.divide(self.M2, self.count - 1, out=np.full(np.shape(self.M2), np.nan), where=self.count > 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        # standard error of the mean
+        return np.sqrt(np.divide(self.variance, self.count, out=np.full(np.shape(self.M2), np.nan), where=self.count > 0))
+
+    def confidence_interval(self, level=0.95):
+        '''
+        (low, high) of the confidence interval of the mean, from the t distribution with count - 1 degrees of freedom
+        '''
+        from scipy import stats
+        with np.errstate(invalid='ignore'):
+            half_width = stats.t.ppf(0.5 + level / 2, self.count - 1) * self.sem
+        return self.mean - half_width, self.mean + half_width
+
+
+class _Feed(Observer):
+    # passes the rates of a network that is run on its own to the ensemble, one column per step
+    name = '_ensemble'
+
+    def __init__(self, ensemble):
+        self.ensemble = ensemble
+
+    def start(self, net):
+        self.ensemble.start(net)
+
+    def update(self, t, r):
+        self.ensemble.update(t, r[:, None])
+
+
+class Ensemble:
+    '''
+    moments across the networks of an ensemble, accumulated while they run
+
+    activity:    moments of the recorded activity (params.record_neurons x params.record_times),
+                 updated at every step from the (N, B) rates of the batch
+    statistics:  moments of the results of the observers of each network (e.g. the bump_center
+                 trajectory), bump centers are unwrapped first so crossing the ring does not
+                 average to the middle
+    subspace:    moments of the explained variance ratio of the first subspace_k principal
+                 components of each network, needs the rasters of one batch at a time
+
+        ensemble = Ensemble(subspace_k=5)
+        ensemble.run(networks, batch_size=64, observers=[BumpCenter()])
+        ensemble.activity.mean, ensemble.activity.confidence_interval(0.95)
+    '''
+    def __init__(self, activity=True, subspace_k=None):
+        self.record_activity = activity
+        self.subspace_k = subspace_k
+        self.activity = None
+        self.statistics = {}
+        self.subspace = None
+        self.size = 0
+
+    def start(self, net):
+        # called at the start of every batch, the moments are allocated once
+        if self.record_activity and self.activity is None:
+            params = net.params
+            self.activity = RunningMoments((len(params.record_index), len(params.record_times)))
+            self.columns = np.full(params.T, -1)
+            self.columns[params.record_times] = np.arange(len(params.record_times))
+            self.neurons = slice(None) if params.record_neurons is None else params.record_index
+
+    def update(self, t, r):
+        if self.activity is not None and self.columns[t] >= 0:
+            self.activity.add(r[self.neurons].T, (slice(None), self.columns[t]))
+
+    def observer(self):
+        return _Feed(self)
+
+    def add(self, net):
+        '''
+        statistics and subspace of a finished network
+        '''
+        self.size += 1
+        for name, value in net.statistics.items():
+            value = np.asarray(value, dtype=np.float64)
+            if name == 'bump_center':
+                value = unwrap(value, net.params.N)
+            if name not in self.statistics:
+                self.statistics[name] = RunningMoments(value.shape)
+            self.statistics[name].add(value[None])
+        if self.subspace_k is not None:
+            ratio = pca(net.R, self.subspace_k)['explained_variance_ratio']
+            if self.subspace is None:
+                self.subspace = RunningMoments((self.subspace_k,))
+            self.subspace.add(ratio[None], slice(0, len(ratio)))
+
+    def run(self, networks, batch_size=64, observers=None):
+        '''
+        simulate the networks in batches and accumulate them. networks can be a generator, only
+        one batch of batch_size networks exists at a time (None runs all of them in one batch)
+        '''
+        from .batch import BatchRunner
+        record = self.subspace_k is not None
+        networks = iter(networks)
+        while True:
+            batch = list(itertools.islice(networks, batch_size))
+            if not batch:
+                return self
+            for _, finished in BatchRunner(batch, batch_size).iter_batches(observers, record, self):
+                for net in finished:
+                    self.add(net)
+                    net.R = None
+
+    def summary(self):
+        return {'size': self.size,
+                'activity': self.activity,
+                'statistics': self.statistics,
+                'subspace': self.subspace}
+
+
+def unwrap(centers, N):
+    '''
+    bump center trajectory without the jumps at the ends of the ring, nan (no activity) stays nan
+    '''
+    centers = np.array(centers, dtype=np.float64)
+    valid = ~np.isnan(centers)
+    centers[valid] = np.unwrap(centers[valid] * 2 * np.pi / N) * N / (2 * np.pi)
+    return centers
@@ -0,0 +1,175 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import warnings
+import numpy as np
+
+class LinearFastForward:
+    '''
+    replaces the per-step recurrent product of RingNetwork.run while the dynamics are linear
+
+    as long as no rate is rectified the update is the affine map r <- A r + c with A = diag(P) W
+    and c = P (I_E - I_I). In the eigenbasis of A every step is a multiplication by the eigenvalues,
+    so k future states follow from the powers lambda^1..lambda^k at once:
+
+        r(t+m) = V (lambda^m a + (1 + lambda + ... + lambda^(m-1)) b),  a = V^-1 r(t), b = V^-1 c
+
+    the eigenbasis is the Fourier basis for the circulant W (P = 1), and that of W restricted to the
+    active neurons for a 0/1 projection P (inhibited neurons are zero after the first step).
+
+    states of a block are exact up to the first one with a negative rate, that one is rectified,
+    which is exactly the regular update, and the rest of the block is discarded. The block length
+    doubles after every block without rectification (up to max_block). While rectification fires
+    at every step the regular update (recurrent, a function computing W @ r) is used instead and
+    a block is only tried again after a waiting time that doubles with every failed attempt
+
+    advance jumps over steps whose states are not needed (nothing observes them and they are not
+    recorded). With the fixed point r* = V b / (1 - lambda), every state of the next k steps is
+
+        r(t+m) = r* + V lambda^m (a - b / (1 - lambda)),  m = 1..k
+
+    so no rate can become negative while min r* is larger than
+
+        sum_i max_j |V_ji| max(|lambda_i|, |lambda_i|^k) |a_i - b_i / (1 - lambda_i)|
+
+    Where this bound holds the state k steps ahead is computed from lambda^k alone, one transform
+    instead of k, elsewhere the steps are taken one block at a time as in step
+
+    the eigenbasis of a projected W can be ill-conditioned (large N, small p_inh), the transforms
+    then lose too many digits and every step is a regular one
+    '''
+    def __init__(self, weights, P, drive, recurrent, max_block=64, atol=1e-12):
+        N = len(weights)
+        self.N = N
+        self.P = P
+        self.drive = drive
+        self.recurrent = recurrent
+        self.max_block = max_block
+        self.atol = atol
+        self.block = 1
+        self.buffer = []
+        self.wait = 0                # regular steps left before the next block is tried
+        self.backoff = 1
+        self.spectral = True         # False if the eigenbasis is unusable, all steps are regular
+
+        P = np.broadcast_to(np.asarray(P, dtype=float), (N,))
+        c = P * np.broadcast_to(drive, (N,))
+
+        if np.all(P == 1):
+            # circulant, diagonal in Fourier space
+            self.active = None
+            self.eigenvalues = np.fft.rfft(weights)
+            self._forward = lambda x: np.fft.rfft(x, axis=-1)
+            self._inverse = lambda x: np.fft.irfft(x, n=N, axis=-1)
+            # largest entry of each Fourier mode in real space, the mean and the Nyquist mode count once
+            self.mode_weights = np.full(len(self.eigenvalues), 2.0 / N)
+            self.mode_weights[0] = 1.0 / N
+            if N % 2 == 0:
+                self.mode_weights[-1] = 1.0 / N
+        else:
+            self.active = np.flatnonzero(P)
+            W_AA = weights[(self.active[:, None] - self.active[None, :]) % N]
+            self.eigenvalues, V = np.linalg.eig(W_AA)
+            if np.linalg.cond(V) > 1e8:
+                warnings.warn('Eigenbasis of the projected weight matrix is ill-conditioned, fast forward takes regular steps.')
+                self.spectral = False
+                self.fixed_hat = None
+                return
+            V_inverse = np.linalg.inv(V)
+            self._forward = lambda x: x[..., self.active] @ V_inverse.T
+            self._inverse = lambda x: self._embed(np.real(x @ V.T))
+            self.mode_weights = np.max(np.abs(V), axis=0)
+
+        self.c_hat = self._forward(c)
+
+        # fixed point of the linear map, none if an eigenvalue is (close to) one
+        one_minus = 1 - self.eigenvalues
+        if np.all(np.abs(one_minus) > 1e-12):
+            self.fixed_hat = self.c_hat / one_minus
+            fixed = self._inverse(self.fixed_hat)
+            self.fixed_min = np.min(fixed if self.active is None else fixed[self.active])
+            self.fixed_scale = np.max(np.abs(fixed))
+        else:
+            self.fixed_hat = None
+
+    def _embed(self, states_active):
+        states = np.zeros(states_active.shape[:-1] + (self.N,))
+        states[..., self.active] = states_active
+        return states
+
+    def _propagate(self, r, k):
+        m = np.arange(1, k + 1)[:, None]
+        powers = self.eigenvalues[None, :] ** m
+        one_minus = 1 - self.eigenvalues[None, :]
+        near_one = np.abs(one_minus) < 1e-12
+        geometric = np.where(near_one, m, (1 - powers) / np.where(near_one, 1, one_minus))
+        return self._inverse(powers * self._forward(r)[None, :] + geometric * self.c_hat[None, :])
+
+    def _propagate_to(self, r, k):
+        # the state k steps after r alone
+        power = self.eigenvalues ** k
+        one_minus = 1 - self.eigenvalues
+        near_one = np.abs(one_minus) < 1e-12
+        geometric = np.where(near_one, k, (1 - power) / np.where(near_one, 1, one_minus))
+        return self._inverse(power * self._forward(r) + geometric * self.c_hat)
+
+    def _linear_for(self, r, k):
+        '''
+        True if no rate can become negative in the next k steps after r, see the class docstring
+        '''
+        if self.fixed_hat is None or self.fixed_min <= 0:
+            return False
+        deviation = np.abs(self._forward(r) - self.fixed_hat)
+        modulus = np.abs(self.eigenvalues)
+        bound = np.sum(self.mode_weights * np.maximum(modulus, modulus ** k) * deviation)
+        return self.fixed_min - bound > self.atol * max(self.fixed_scale, np.max(np.abs(r)))
+
+    def advance(self, r, k):
+        '''
+        state k steps after r, same result as k calls of step. Stretches in which no rate can be
+        rectified are skipped, their states are never computed
+        '''
+        while k > 0:
+            # single steps come from the blocks of step, which share their transforms
+            if k > 1 and not self.buffer and self.wait == 0 and self._linear_for(r, k):
+                return np.maximum(self._propagate_to(r, k), 0)
+            r = self.step(r)
+            k -= 1
+        return r
+
+    def _regular_step(self, r):
+        r_next = self.P * (self.recurrent(r) + self.drive)
+        r_next[r_next<0] = 0
+        return r_next
+
+    def step(self, r):
+        '''
+        next state after r, same result as P * (W @ r + I_E - I_I) followed by rectification.
+        Consecutive calls have to pass the previously returned state
+        '''
+        if not self.spectral:
+            return self._regular_step(r)
+        if self.buffer:
+            return self.buffer.pop(0)
+        if self.wait > 0:
+            self.wait -= 1
+            return self._regular_step(r)
+
+        states = self._propagate(r, self.block)
+        # entries below the rounding noise of the transforms are zero, negative ones beyond it are rectified
+        threshold = self.atol * max(np.max(np.abs(states)), np.finfo(float).tiny)
+        states[np.abs(states) < threshold] = 0
+        rectified = np.flatnonzero(np.min(states, axis=1) < 0)
+        if len(rectified) == 0:
+            self.block = min(2 * self.block, self.max_block)
+            self.backoff = 1
+        else:
+            first = rectified[0]
+            states = np.maximum(states[:first + 1], 0)
+            if first == 0:
+                # still rectifying, step regularly for a while
+                self.wait = self.backoff
+                self.backoff = min(2 * self.backoff, self.max_block)
+            self.block = max(first, 1)
+        self.buffer = list(states)
+        return self.buffer.pop(0)
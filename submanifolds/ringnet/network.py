@@ -2,6 +2,12 @@
 # The MIT License
 
 import numpy as np
+import functools
+from .operator import CirculantOperator
+from .termination import SteadyStateDetector
+from .fastforward import LinearFastForward
+from .connectivity import sparse_excitation, SparseOperator
+from ..utils import profile
 
 class RingNetwork:
     def __init__(self, params):
@@ -12,33 +18,87 @@ class RingNetwork:
         self.I_I = None
         self.P = None
         self.R = None
+        self.statistics = {}
+        self.termination = None
+        self._connectivity = None   # parameters the current kernel was built from
+        self._W = None              # cached dense weight matrix
+        self._W_cast = None         # copy of the dense weight matrix in the precision of the run
+        self._sparse = None         # SparseOperator of the weights for sparse connectivity
         
     def _connect(self):
-
-        # determine center of gaussian kernel for neuron j
-        c = self.params.shift % self.params.N
-
-        # compute distance (counter clockwise) from neuron j to each of the other neurons i
-        d = abs(self.params.x - c)
-
-        # distance on circle is minimum of clockwise and counterclockwise distance
-        dx = np.minimum(d, self.params.N-d)
-
-        # compute the weights with gaussian kernel, parameters: w_E, w_I, shift, sigma
-        weights = self.params.w_E*np.exp(-0.5 * dx**2/self.params.sigma**2) - self.params.w_I    
+        with profile.phase('connect'):
+            self._connect_weights()
         
-        # rescale weights by weight factor, computed within parameter class
-        weights = self.params.weight_factor * weights
+    def _connect_weights(self):
+        p = self.params
+        if p.connectivity == 'circulant':
+            # the kernel only depends on a few parameters, a sweep over e.g. seed reuses the cached one
+            self.weights = gaussian_kernel(p.N, p.shift, p.sigma, p.w_E, p.w_I, p.weight_factor)
+            self._sparse = None
+        elif p.connectivity == 'sparse':
+            # no shared kernel, excitation per neuron plus global inhibition, see connectivity.py
+            E = sparse_excitation(p.N, p.shifts, p.sigmas, p.w_E, p.weight_factor, p.cutoff, p.p_connect, p.seed)
+            self.weights = None
+            self._sparse = SparseOperator(E, p.weight_factor * p.w_I)
+        else:
+            raise Exception("Keyword '" + str(p.connectivity) + "' is not a valid connectivity. Please choose 'circulant' or 'sparse'.")
+        self._connectivity = self._connectivity_key()
+        self._W = None
+        self._W_cast = None
         
-        # store weights
-        self.weights = weights
+    def _connectivity_key(self):
+        # parameters that determine the weights, used to detect parameter changes
+        p = self.params
+        if p.connectivity == 'sparse':
+            # the seed enters through the jittered shifts and sigmas and, with p_connect < 1, the thinning
+            return (p.connectivity, p.N, p.w_E, p.w_I, p.weight_factor, p.shifts.tobytes(), p.sigmas.tobytes(),
+                    p.cutoff, p.p_connect, p.seed if p.p_connect < 1 else None)
+        return (p.N, p.shift, p.sigma, p.w_E, p.w_I, p.weight_factor)
+    
+    def _check_connectivity(self):
+        if self._connectivity != self._connectivity_key():
+            self._connect()
 
     @property
     def W(self):
-        W = np.zeros((self.params.N,self.params.N))
-        for i in range(self.params.N):
-            W[:, i] = np.roll(self.weights, i)
-        return W
+        self._check_connectivity()
+        if self._W is None:
+            with profile.phase('weight_matrix'):
+                self._W = self._dense_weights()
+                self._W.flags.writeable = False
+        return self._W
+    
+    def _dense_weights(self):
+        if self._sparse is not None:
+            # dense copy of sparse connectivity, only meant for small N
+            return self._sparse.toarray()
+        else:
+            # W[:, i] is the kernel rolled by i, i.e. W[j, i] = weights[(j - i) % N]. Row j
+            # is a window into the reversed kernel repeated twice, so all rows are built
+            # from one strided view instead of N calls to np.roll
+            N = self.params.N
+            reversed_weights = self.weights[::-1]
+            windows = np.lib.stride_tricks.sliding_window_view(np.concatenate((reversed_weights, reversed_weights)), N)
+            return np.ascontiguousarray(windows[N-1::-1])
+    
+    def operator(self, projected=False):
+        '''
+        matrix-free view of W (or of diag(P) @ W if projected), never materializes the N x N array.
+        A SparseOperator for sparse connectivity
+        '''
+        self._check_connectivity()
+        if self._sparse is not None:
+            if projected:
+                raise Exception('Projected operator is only available for circulant connectivity.')
+            return self._sparse
+        return CirculantOperator(self.weights, self.params.P if projected else None)
+        
+    def __getstate__(self):
+        # the dense matrix is a cache, rebuild it from the kernel instead of pickling N^2 values
+        state = self.__dict__.copy()
+        state['_W'] = None
+        state['_W_cast'] = None
+        return state
         
     def _set_inputs(self):   
         self.I_E = self.params.I_E
@@ -52,20 +112,225 @@ class RingNetwork:
         self._connect()
         self._set_inputs()
         self._built = True
+    
+    def _build_like(self, other):
+        # other has the same connectivity parameters (see BatchRunner), its weights are shared instead of built again
+        self.weights = other.weights
+        self._sparse = other._sparse
+        self._connectivity = other._connectivity
+        self._set_inputs()
+        self._built = True
+        
+    def _weight_matrix(self, dtype):
+        W = self.W
+        if W.dtype == dtype:
+            return W
+        if self._W_cast is None or self._W_cast.dtype != dtype:
+            self._W_cast = W.astype(dtype)
+            self._W_cast.flags.writeable = False
+        return self._W_cast
+        
+    def _recurrent(self, dtype=None):
+        '''
+        function recurrent(r, out=None) computing the recurrent input W @ r, for a vector r or an
+        (N, B) matrix of rates, written into the preallocated array out if given. The engine
+        applies to circulant connectivity, sparse connectivity always uses sparse products
+        '''
+        dtype = np.dtype(self.params.dtype if dtype is None else dtype)
+        self._check_connectivity()
+        if self._sparse is not None:
+            # O(synapses) per step, excitation from the CSC matrix and inhibition from the summed rates
+            operator = self._sparse if self._sparse.dtype == dtype else self._sparse.astype(dtype)
+            return operator.matmat
+        elif self.params.engine == 'dense':
+            # reference path, O(N^2) matrix-vector product with the full weight matrix
+            return functools.partial(np.matmul, self._weight_matrix(dtype))
+        elif self.params.engine == 'fft':
+            # W is circulant, so W @ r is a circular convolution of the kernel with r,
+            # O(N log N) per step with the spectrum of the kernel precomputed once and the
+            # transforms written into buffers kept by the operator
+            return self.operator().matmat
+        else:
+            raise Exception("Keyword '" + str(self.params.engine) + "' is not a valid propagation engine. Please choose 'dense' or 'fft'.")
+    
+    def _step(self):
+        '''
+        function step(r, out) writing the next (rectified) state after r into out, allocation free
+        '''
+        N = self.params.N
+        dtype = np.dtype(self.params.dtype)
+        recurrent = self._recurrent(dtype)
+        drive = np.asarray(np.broadcast_to(self.I_E - self.I_I, (N,)), dtype=dtype)
+        P = np.asarray(np.broadcast_to(self.P, (N,)), dtype=dtype)
+        
+        if self.params.fast_forward:
+            # consecutive calls have to pass the previously returned state, as in run
+            fast_forward = self._fast_forward(recurrent)
+            def step(r, out):
+                np.copyto(out, fast_forward.step(r))
+                return out
+            return step
+        
+        def step(r, out):
+            recurrent(r, out=out)
+            out += drive
+            out *= P
+            return np.maximum(out, 0, out=out)
+        
+        if profile.active() is not None:
+            # only a profiled run pays for counting the rectified rates
+            def profiled_step(r, out):
+                recurrent(r, out=out)
+                out += drive
+                out *= P
+                profile.count('rectified', np.count_nonzero(out < 0))
+                return np.maximum(out, 0, out=out)
+            return profiled_step
+        return step
+    
+    def _fast_forward(self, recurrent):
+        if self._sparse is not None:
+            raise Exception('Fast forward is only available for circulant connectivity.')
+        return LinearFastForward(self.weights, self.P, self.I_E - self.I_I, recurrent, self.params.fast_forward_block)
+    
+    def _allocate_raster(self, record, raster_file):
+        if not record:
+            return None
+        shape = (len(self.params.record_index), len(self.params.record_times))
+        dtype = np.dtype(self.params.dtype)
+        if raster_file is not None:
+            # on-disk buffer for runs where the raster does not fit in memory
+            return np.lib.format.open_memmap(raster_file, mode='w+', dtype=dtype, shape=shape)
+        return np.zeros(shape, dtype=dtype)
         
-    def run(self):
+    def run(self, observers=None, record=False, raster_file=None):
+        '''
+        observers:   list of Observer instances, each reduces the rates step by step,
+                     results are stored in self.statistics under the observer's name
+        record:      store the raster in self.R, off by default (self.R stays None). It holds
+                     the neurons params.record_neurons at the time steps params.record_times, all
+                     N neurons at all T steps by default
+        raster_file: path of a .npy file used as memory-mapped buffer for the raster
+
+        with params.adaptive the run stops as soon as the activity died out or reached a fixed point,
+        a travelling bump or a periodic state, also one that decays or grows at a constant rate.
+        self.termination holds the reason, the number of simulated steps and the factor per period,
+        with params.adaptive_fill the remaining steps are generated from the steady state
+
+        with params.fast_forward stretches without rectification are propagated blocks of steps at a
+        time in the eigenbasis of the recurrent weights instead of one matrix-vector product per step.
+        Without observers and params.adaptive only the recorded states are computed, stretches in
+        between that cannot be rectified are skipped
+        '''
         if self._built == False:
             self._build()
         
-        W = self.W    
-        r_store = np.zeros((self.params.N, self.params.T))
-        r = self.params.initial_r
+        observers = [] if observers is None else list(observers)
+        
+        with profile.phase('run'):
+            self._simulate(observers, record, raster_file)
+        profile.count('steps', self.termination['step'])
+    
+        self._after_run()
+    
+    def _simulate(self, observers, record, raster_file):
+        if self.params.fast_forward and not observers and not self.params.adaptive:
+            return self._simulate_recorded(record, raster_file)
+        step = self._step()
+        r_store = self._allocate_raster(record, raster_file)
+        T = self.params.T
+        
+        # column of R each time step is stored in, -1 if it is not recorded
+        columns = np.full(T, -1)
+        columns[self.params.record_times] = np.arange(len(self.params.record_times))
+        neurons = slice(None) if self.params.record_neurons is None else self.params.record_index
+        
+        # two state buffers, each step writes into the one not holding the current state
+        r = np.array(np.broadcast_to(self.params.initial_r, (self.params.N,)), dtype=self.params.dtype)
+        r_next = np.empty_like(r)
+        
+        detector = SteadyStateDetector(self.params, self.P, self.I_E - self.I_I) if self.params.adaptive else None
+        self.termination = {'reason': 'completed', 'step': T}
+        
+        for observer in observers:
+            observer.start(self)
+        
+        for t in range(T):
+            if r_store is not None and columns[t] >= 0:
+                r_store[:, columns[t]] = r[neurons]
+            for observer in observers:
+                observer.update(t, r)
+            step(r, r_next)
+            
+            if detector is not None and t + 1 < T:
+                steady = detector.check(r, r_next)
+                if steady is not None:
+                    reason, period, shift, factor = steady
+                    self.termination = {'reason': reason, 'step': t + 1, 'period': period, 'shift': shift, 'factor': factor}
+                    break
+            r, r_next = r_next, r
         
-        for t in range(self.params.T):
-            r_store[:, t] = r
-            r = self.P * (W @ r + self.I_E - self.I_I)
-            r[r<0] = 0
+        if self.termination['step'] < T:
+            if self.params.adaptive_fill:
+                # r_next is the state at step t + 1, every later one follows from rolling and scaling
+                if reason == 'extinction':
+                    r_next = np.zeros_like(r_next)
+                states = detector.extend(r_next, period, shift, factor)
+                for u in range(t + 1, T):
+                    r = r_next if u == t + 1 else next(states)
+                    if r_store is not None and columns[u] >= 0:
+                        r_store[:, columns[u]] = r[neurons]
+                    for observer in observers:
+                        observer.update(u, r)
+            elif r_store is not None:
+                r_store = r_store[:, :np.searchsorted(self.params.record_times, t + 1)]
         
+        if isinstance(r_store, np.memmap):
+            r_store.flush()
+        
+        self.R = r_store
+        self.statistics = {observer.name: observer.result() for observer in observers}
+    
+    def _simulate_recorded(self, record, raster_file):
+        # nothing looks at the states between the recorded ones, the fast forward jumps from one
+        # recorded step to the next, see LinearFastForward.advance
+        r_store = self._allocate_raster(record, raster_file)
+        self.termination = {'reason': 'completed', 'step': self.params.T}
+        self.statistics = {}
+        if r_store is not None:
+            fast_forward = self._fast_forward(self._recurrent())
+            neurons = slice(None) if self.params.record_neurons is None else self.params.record_index
+            r = np.array(np.broadcast_to(self.params.initial_r, (self.params.N,)), dtype=np.float64)
+            t = 0
+            for column, u in enumerate(self.params.record_times):
+                r = fast_forward.advance(r, u - t)
+                r_store[:, column] = r[neurons]
+                t = u
+            if isinstance(r_store, np.memmap):
+                r_store.flush()
         self.R = r_store
+
+
+@functools.lru_cache(maxsize=64)
+def gaussian_kernel(N, shift, sigma, w_E, w_I, weight_factor):
+    '''
+    connectivity kernel, weights from neuron 0 onto every neuron. Memoized, the returned array is read-only
+    '''
+    x = np.arange(N)
+    
+    # determine center of gaussian kernel for neuron j
+    c = shift % N
+
+    # compute distance (counter clockwise) from neuron j to each of the other neurons i
+    d = abs(x - c)
+
+    # distance on circle is minimum of clockwise and counterclockwise distance
+    dx = np.minimum(d, N-d)
+
+    # compute the weights with gaussian kernel, parameters: w_E, w_I, shift, sigma
+    weights = w_E*np.exp(-0.5 * dx**2/sigma**2) - w_I    
     
-        self._after_run()
\ No newline at end of file
+    # rescale weights by weight factor, computed within parameter class
+    weights = weight_factor * weights
+    weights.flags.writeable = False
+    return weights
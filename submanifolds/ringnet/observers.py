@@ -0,0 +1,111 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+class Observer:
+    '''
+    per-step reducer passed to RingNetwork.run, sees the rates at every time step and
+    keeps only a summary, so the full (N, T) raster does not have to be stored
+
+    start is called once before the first step, update with the rates at each step t,
+    result returns the summary which ends up in net.statistics[name]. Steps that were never
+    simulated (an adaptive run stopped early without adaptive_fill) are nan
+    '''
+    name = 'observer'
+
+    def start(self, net):
+        self.N = net.params.N
+        self.T = net.params.T
+
+    def update(self, t, r):
+        pass
+
+    def result(self):
+        return None
+
+
+class _TimeSeries(Observer):
+    # one scalar per time step, subclasses define _reduce
+    def start(self, net):
+        super().start(net)
+        self.values = np.full(self.T, np.nan)
+
+    def update(self, t, r):
+        self.values[t] = self._reduce(r)
+
+    def result(self):
+        return self.values
+
+
+class _CircularMoment(_TimeSeries):
+    # first circular moment of the rate distribution on the ring, nan if there is no activity
+    def start(self, net):
+        super().start(net)
+        self.phase = np.exp(2j * np.pi * np.arange(self.N) / self.N)
+
+    def _moment(self, r):
+        total = np.sum(r)
+        if total <= 0:
+            return np.nan
+        return np.dot(self.phase, r) / total
+
+
+class BumpCenter(_CircularMoment):
+    '''
+    bump center by circular mean, in units of neurons
+    '''
+    name = 'bump_center'
+
+    def _reduce(self, r):
+        z = self._moment(r)
+        return np.angle(z) * self.N / (2 * np.pi) % self.N
+
+
+class BumpWidth(_CircularMoment):
+    '''
+    bump width by circular standard deviation, in units of neurons, nan without activity and
+    for (up to rounding) uniform activity, which has no bump
+    '''
+    name = 'bump_width'
+
+    def _reduce(self, r):
+        length = np.abs(self._moment(r))
+        if not length > self.N * np.finfo(float).eps:
+            return np.nan
+        return np.sqrt(-2 * np.log(length)) * self.N / (2 * np.pi)
+
+
+class PeakRate(_TimeSeries):
+    name = 'peak_rate'
+
+    def _reduce(self, r):
+        return np.max(r)
+
+
+class TotalActivity(_TimeSeries):
+    name = 'total_activity'
+
+    def _reduce(self, r):
+        return np.sum(r)
+
+
+class DecimatedRaster(Observer):
+    '''
+    raster that keeps every k-th time step, shape (N, ceil(T / every))
+    '''
+    name = 'decimated_raster'
+
+    def __init__(self, every=10):
+        self.every = every
+
+    def start(self, net):
+        super().start(net)
+        self.raster = np.full((self.N, -(-self.T // self.every)), np.nan)
+
+    def update(self, t, r):
+        if t % self.every == 0:
+            self.raster[:, t // self.every] = r
+
+    def result(self):
+        return self.raster
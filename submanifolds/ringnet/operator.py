@@ -0,0 +1,85 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+# numpy >= 2 writes ffts into given arrays, older versions allocate the result
+FFT_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+class CirculantOperator:
+    '''
+    matrix-free view of the recurrent weight matrix, W[j, i] = weights[(j - i) % N],
+    optionally projected onto the active neurons, diag(P) @ W
+
+    exposes shape, dtype, matvec and rmatvec so it can be passed to
+    scipy.sparse.linalg.aslinearoperator and the iterative solvers directly
+    '''
+    def __init__(self, weights, P=None):
+        self.weights = np.asarray(weights)
+        self.N = len(self.weights)
+        self.shape = (self.N, self.N)
+        self.dtype = self.weights.dtype
+        self.spectrum = np.fft.rfft(self.weights)   # spectrum of the kernel, computed once
+
+        # P is 1 (no projection) or a vector with one entry per neuron
+        self.P = None if P is None or np.isscalar(P) and P == 1 else np.asarray(P)
+        self._workspace = None                      # spectrum and buffer of matmat with out, per shape and dtype
+
+    def _convolve(self, spectrum, x):
+        # circular convolution along the neuron axis, works for vectors and (N, B) matrices
+        x_fft = np.fft.rfft(x, axis=0)
+        if x.ndim == 2:
+            spectrum = spectrum[:, None]
+        return np.fft.irfft(spectrum * x_fft, n=self.N, axis=0)
+
+    def _project(self, x):
+        if self.P is None:
+            return x
+        return self.P[:, None] * x if x.ndim == 2 else self.P * x
+
+    def _convolve_into(self, x, out):
+        # the same convolution without allocating, in the precision of out
+        key = (x.shape, out.dtype)
+        if self._workspace is None or self._workspace[0] != key:
+            complex_dtype = np.result_type(out.dtype, np.complex64)
+            spectrum = self.spectrum.astype(complex_dtype)
+            if x.ndim == 2:
+                spectrum = spectrum[:, None]
+            self._workspace = (key, spectrum, np.empty((self.N // 2 + 1,) + x.shape[1:], dtype=complex_dtype))
+        _, spectrum, x_fft = self._workspace
+        np.fft.rfft(x, axis=0, out=x_fft)
+        x_fft *= spectrum
+        return np.fft.irfft(x_fft, n=self.N, axis=0, out=out)
+
+    def matmat(self, X, out=None):
+        '''
+        W @ X (diag(P) @ W @ X if projected), written into out if given. With out, repeated calls for
+        the same shape reuse one spectrum buffer and numpy >= 2 writes the transforms in place
+        '''
+        X = np.asarray(X)
+        if out is None:
+            return self._project(self._convolve(self.spectrum, X))
+        if FFT_OUT and out.dtype == X.dtype and out.flags.c_contiguous:
+            self._convolve_into(X, out)
+        else:
+            out[...] = self._convolve(self.spectrum, X)
+        if self.P is not None:
+            out *= self.P[:, None] if out.ndim == 2 else self.P
+        return out
+
+    def rmatmat(self, X):
+        # W^T is circulant with the conjugate spectrum, (diag(P) W)^T = W^T diag(P)
+        return self._convolve(np.conj(self.spectrum), self._project(np.asarray(X)))
+
+    def matvec(self, x):
+        return self.matmat(np.ravel(x))
+
+    def rmatvec(self, x):
+        return self.rmatmat(np.ravel(x))
+
+    def __matmul__(self, x):
+        return self.matmat(x)
+
+    def toarray(self):
+        # materialize the dense matrix, only meant for small N
+        return self.matmat(np.eye(self.N))
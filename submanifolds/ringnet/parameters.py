@@ -4,6 +4,8 @@
 import itertools
 import warnings
 import numpy as np
+from collections import OrderedDict
+from ..utils import profile
 
 class Parameters:
     def __init__(self, params_to_update=None):
@@ -26,139 +28,322 @@ class Parameters:
         self.type = 'additive'     # type of interaction between neurons, additive or multiplicative
         self.stim = 'transient'    # type of input, persistent or transient
         self.rescale = True        # flag controls whether recurrent weights are rescaled based on sparsity
+        self.engine = 'dense'      # propagation engine for the recurrent input, dense (reference) or fft
+        self.adaptive = False      # stop early once activity died out or reached a steady state, see termination.py
+        self.adaptive_tol = 1e-12  # relative tolerance for detecting a steady state, at least 4 eps of dtype
+        self.adaptive_atol = 1e-12 # rates below this fraction of the largest rate so far count as extinct
+        self.adaptive_patience = 3 # number of consecutive steps a steady state has to persist
+        self.adaptive_max_period = 2 # longest period (in time steps) of periodic steady states that is detected
+        self.adaptive_fill = True  # after stopping early, fill the rest of the T steps from the steady state
+        self.fast_forward = False  # propagate blocks of steps spectrally while no rate is rectified, see fastforward.py
+        self.fast_forward_block = 64 # longest block of steps propagated at once
+        self.dtype = 'float64'     # floating point precision of the rates and the stored activity, float64 or float32
+        self.record_every = 1      # store every k-th time step of the activity in R
+        self.record_start = 0      # first time step stored in R
+        self.record_stop = None    # time step at which storing R stops, None runs to T
+        self.record_neurons = None # indices of the neurons stored in R, None stores all
+        self.connectivity = 'circulant' # recurrent weights, circulant (one shared kernel) or sparse (per neuron), see connectivity.py
+        self.shift_jitter_percent = 0 # std of the per-neuron shift around shift_percent, sparse connectivity only
+        self.sigma_jitter = 0      # std of the log of the per-neuron kernel width around sigma, sparse connectivity only
+        self.cutoff = 4            # excitatory synapses beyond cutoff * sigma are dropped, None keeps all N^2, sparse connectivity only
+        self.p_connect = 1         # probability that an excitatory synapse exists, sparse connectivity only
         
-        '''
-        if parameter updates are required, then update them
-        '''
-        self._update_params(params_to_update)
+        self._base = list(vars(self))  # names of the main parameters
+        self._overrides = {}           # derived parameters set explicitly, see _update_params
+        self._node_keys = {}           # main parameter values each derived node was last computed from
         
-        '''
-        based on main parameters compute the derived parameters
-        '''
-        self._compute_derived_params()
+        with profile.phase('parameters'):
+            '''
+            if parameter updates are required, then update them
+            '''
+            self._update_params(params_to_update)
+            
+            '''
+            based on main parameters compute the derived parameters
+            '''
+            self._compute_derived_params()
     
     def _update_params(self, params_to_update):
-        # TODO should check that derived parameters are changed correctly
         if params_to_update is not None:
             for key_i, key in enumerate(params_to_update['keys']):
-                if hasattr(self, key):
-                    setattr(self, key, params_to_update['setting'][key_i])
+                value = params_to_update['setting'][key_i]
+                if key in self._base:
+                    setattr(self, key, value)
+                elif key in DERIVED_OUTPUTS:
+                    # the value replaces the computed one and everything depending on it is recomputed from it
+                    warnings.warn("'" + key + "' is a derived parameter. Its computed value is replaced and the parameters depending on it are recomputed from the given value.")
+                    self._overrides[key] = value
                 else:
-                    warnings.warn("'" + key + "' is a derived parameter or doesn't exist. Setting derived parameters is not tested. \
-                                  Could lead to unexpected effects due to parameter dependencies. Proceed with caution.")
-            
-    def _compute_derived_params(self):
-        '''
-        space parameters
-        '''
-        self.x = np.arange(self.N)                # defines each neurons position on the ring
-        self.sigma = self.sigma_percent * self.N  # defines the std of the excitatory gaussian connectivity
-        self.shift = self.shift_percent * self.N  # defines the amount of shift in the connectivity profile
-        
-        '''
-        recurrent weights
-        '''
-        self.area = 2 * int(np.sum(np.exp(-0.5 * self.x**2/self.sigma**2))) # area under the gaussian connectivity kernel
-        self.w_E = self._w_E/self.area                                # normalize exc weights
-        self.w_I = self._w_I/self.area                                # normalize inh weights
-        
-        # compute rescaling for the recurrent weights if neurons are silenced
-        #if self.p_exc != 0 and self.p_inh != 0:
-        #    raise Exception("Simultaneous selective excitation and inhibition not yet implemented.")
-        #else:
-        
-        if self.stim == 'transient' and self.p_inh != 1 and self.rescale == True:
-            warnings.warn('Recurrent weights were rescaled due to selective inhibition and transient excitatory burst input.')
-            self.weight_factor = (1 / (1 - self.p_inh)) #if self.p_inh <= 0.9 else 10 # removed this
-        #elif self.stim == 'transient' and self.p_exc != 1:
-        #    warnings.warn('Recurrent weights were rescaled due to selective excitation and transient excitatory burst input.')
-        #    self.weight_factor = 1 + 0.15*np.exp(- self.p_exc)
-        else:
-            self.weight_factor = 1
-        
+                    warnings.warn("'" + key + "' doesn't exist and was ignored.")
+    
+    def update(self, params_to_update):
         '''
-        subset receiving selective input
+        change parameters of an existing instance, only the derived parameters depending on them are recomputed
         '''
-        # set random number generator seed
-        np.random.seed(self.seed)
-        
-        # calculate number of neurons that get selective exc or inh
-        n_exc = int(self.p_exc * self.N)
-        n_inh = int(self.p_inh * self.N)
-        
-        if (n_exc != self.p_exc * self.N): 
-            warnings.warn('Number of neurons receiving selective excitation was rounded to ' + str(n_exc) + '.')
-        if (n_inh != self.p_inh * self.N):
-            warnings.warn('Number of neurons receiving selective inhibition was rounded to ' + str(n_inh) + '.')
-        
-        # select a subset from the N neurons to receive the input
-        exc_neuron_indices = np.random.choice(self.N, n_exc, replace=False)
-        inh_neuron_indices = np.random.choice(self.N, n_inh, replace=False)
-        
-        # initialize vectors for the selective subsets 
-        self.sel_exc_subset = np.zeros(self.N)
-        self.sel_inh_subset = np.zeros(self.N)
-        
-        # populate with ones for selected neurons
-        self.sel_exc_subset[exc_neuron_indices] = 1
-        self.sel_inh_subset[inh_neuron_indices] = 1
-        
-        # old way, problem is you get different sized subsets depending on random vector generated
-        #self.sel_exc_subset = (np.random.rand(self.N) <= self.p_exc).astype(float)  # draw subset of neurons to receive selective excitation
-        #self.sel_inh_subset = (np.random.rand(self.N) <= self.p_inh).astype(float)  # draw subset of neurons to receive selective inhibtion
-        
+        with profile.phase('parameters'):
+            self._update_params(params_to_update)
+            self._compute_derived_params()
+            
+    def _compute_derived_params(self):
         '''
-        external inputs
+        evaluate the derived parameter graph in order. A node is skipped if the main parameters it
+        depends on did not change since it was last computed, otherwise its value is looked up in
+        the node's LRU cache (shared by all instances) and only computed on a miss. Nodes that
+        depend on an overridden derived parameter are always computed from the current values
         '''
-        if self.type == 'additive':
-            self.P = 1                 # set P to one for additive case
-            self.w_E_in = self.w_E     # set exc input weight same as recurrent weight
-            self.w_I_in = self.w_E     #self.w_I     # set inh input weight same as recurrent weight
+        tainted = set()
+        for node in DERIVED_GRAPH:
+            key = tuple(getattr(self, name) for name in node.base)
+            uses_override = any(name in tainted for name in node.inputs)
             
-            # calculate excitatory and inhibitory inputs
-            self.I_E = self.w_E_in * self.r_E_in * self.N_E_in * self.sel_exc_subset
-            self.I_I = self.w_I_in * self.r_I_in * self.N_I_in * self.sel_inh_subset
+            try:
+                unchanged = self._node_keys.get(node.name) == key
+            except ValueError:
+                # array valued main parameter (e.g. record_neurons), treat as changed
+                unchanged = False
+            if not self._overrides and unchanged:
+                continue
             
-            if self.stim == 'transient':
-                self.I_E = 0
+            inputs = [getattr(self, name) for name in node.inputs]
+            values = node.compute(inputs) if uses_override else node.cached(key, inputs)
+            for name, value in zip(node.outputs, values):
+                setattr(self, name, value)
+            self._node_keys[node.name] = key
             
-        elif self.type == 'projection':
-            if self.p_inh != 1:
-                # neurons receiving inhibition get set to zero in P vector
-                self.P = 1 - self.sel_inh_subset
-            else:
-                self.P = 1
-            self.I_E = 0
-            self.I_I = 0
-        else:
-            raise Exception("Keyword '" + str(self.type) + "' is not a valid type of input drive to the neurons. Please choose 'additive' or 'projection'.")
+            for name in node.outputs:
+                if name in self._overrides:
+                    setattr(self, name, self._overrides[name])
+                    tainted.add(name)
+            if uses_override:
+                tainted.update(node.outputs)
+
+
+class Derived:
+    '''
+    node of the derived parameter graph, computes outputs from inputs (main or derived parameters)
+
+    results are memoized in a bounded LRU cache keyed on the main parameters the node depends on,
+    directly or through other nodes. Cached arrays are shared between instances and read-only
+    '''
+    maxsize = 64
+
+    def __init__(self, function, inputs, outputs):
+        self.function = function
+        self.name = function.__name__
+        self.inputs = inputs
+        self.outputs = outputs
+        self.base = None      # filled in by _resolve_graph
+        self.cache = OrderedDict()
+
+    def compute(self, inputs):
+        return self.function(*inputs)
+
+    def cached(self, key, inputs):
+        try:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        except TypeError:
+            # unhashable parameter value, nothing to cache
+            return self.compute(inputs)
+
+        values = self.compute(inputs)
+        for value in values:
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        self.cache[key] = values
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return values
+
+    def clear(self):
+        self.cache.clear()
+
+
+'''
+derived parameters, each function gets its inputs in the order declared in the graph below
+'''
+def space(N, sigma_percent, shift_percent):
+    x = np.arange(N)                # defines each neurons position on the ring
+    sigma = sigma_percent * N       # defines the std of the excitatory gaussian connectivity
+    shift = shift_percent * N       # defines the amount of shift in the connectivity profile
+    return x, sigma, shift
+
+def recurrent_weights(x, sigma, _w_E, _w_I):
+    area = 2 * int(np.sum(np.exp(-0.5 * x**2/sigma**2))) # area under the gaussian connectivity kernel
+    w_E = _w_E/area                                      # normalize exc weights
+    w_I = _w_I/area                                      # normalize inh weights
+    return area, w_E, w_I
+
+def heterogeneity(N, shift, sigma, shift_jitter_percent, sigma_jitter, seed):
+    # per-neuron shift and width of the outgoing excitatory kernel, drawn from their own stream of the seed
+    rng = np.random.RandomState([seed, 1])
+    shifts = shift + shift_jitter_percent * N * rng.standard_normal(N) if shift_jitter_percent != 0 else np.full(N, float(shift))
+    sigmas = sigma * np.exp(sigma_jitter * rng.standard_normal(N)) if sigma_jitter != 0 else np.full(N, float(sigma))
+    return shifts, sigmas
+
+def selective_subsets(N, p_exc, p_inh, seed):
+    # random number generator owned by this computation, the global numpy state is never touched,
+    # so the draws depend only on the seed and not on what ran before (safe in worker processes).
+    # RandomState draws the same subsets the former global np.random.seed did
+    rng = np.random.RandomState(seed)
+    
+    # calculate number of neurons that get selective exc or inh
+    n_exc = int(p_exc * N)
+    n_inh = int(p_inh * N)
+    
+    if (n_exc != p_exc * N): 
+        warnings.warn('Number of neurons receiving selective excitation was rounded to ' + str(n_exc) + '.')
+    if (n_inh != p_inh * N):
+        warnings.warn('Number of neurons receiving selective inhibition was rounded to ' + str(n_inh) + '.')
+    
+    # select a subset from the N neurons to receive the input
+    exc_neuron_indices = rng.choice(N, n_exc, replace=False)
+    inh_neuron_indices = rng.choice(N, n_inh, replace=False)
+    
+    # initialize vectors for the selective subsets 
+    sel_exc_subset = np.zeros(N)
+    sel_inh_subset = np.zeros(N)
+    
+    # populate with ones for selected neurons
+    sel_exc_subset[exc_neuron_indices] = 1
+    sel_inh_subset[inh_neuron_indices] = 1
+    
+    # old way, problem is you get different sized subsets depending on random vector generated
+    #sel_exc_subset = (np.random.rand(N) <= p_exc).astype(float)  # draw subset of neurons to receive selective excitation
+    #sel_inh_subset = (np.random.rand(N) <= p_inh).astype(float)  # draw subset of neurons to receive selective inhibtion
+    return sel_exc_subset, sel_inh_subset
+
+def external_inputs(input_type, stim, p_inh, w_E, r_E_in, r_I_in, N_E_in, N_I_in, sel_exc_subset, sel_inh_subset):
+    if input_type == 'additive':
+        P = 1                 # set P to one for additive case
+        w_E_in = w_E          # set exc input weight same as recurrent weight
+        w_I_in = w_E          #w_I     # set inh input weight same as recurrent weight
         
+        # calculate excitatory and inhibitory inputs
+        I_E = w_E_in * r_E_in * N_E_in * sel_exc_subset
+        I_I = w_I_in * r_I_in * N_I_in * sel_inh_subset
         
-        '''
-        initial rate distribution
-        '''
-        self.initial_bump_center = self.sigma # where the bump should start
-        self.initial_bump_std = self.sigma    # width of the initial bump
+        if stim == 'transient':
+            I_E = 0
         
-        # initial rate distribution
-        if np.sum(self.sel_inh_subset) == len(self.sel_inh_subset):                 # global inhibition
-            active_neurons = self.sel_exc_subset
-        elif np.sum(self.sel_inh_subset) != 0:                                      # selective inhibition
-            active_neurons = 1 - self.sel_inh_subset
-        elif np.sum(self.sel_inh_subset) == 0 and np.sum(self.sel_exc_subset) != 0: # no inhibition, selective excitation
-            active_neurons = self.sel_exc_subset
-        elif np.sum(self.sel_inh_subset) == 0 and np.sum(self.sel_exc_subset) == 0: # no inhibition or excitation
-            active_neurons = 1
+    elif input_type == 'projection':
+        w_E_in = None
+        w_I_in = None
+        if p_inh != 1:
+            # neurons receiving inhibition get set to zero in P vector
+            P = 1 - sel_inh_subset
         else:
-            warnings.warn('Something went wrong. Initial rate distribution is not set correctly.')
-         
-        # set initial rate dist
-        self.initial_r = active_neurons * np.exp(-0.5 * (self.x - self.initial_bump_center)**2 / self.initial_bump_std**2)
-        
-        
-        ''' WEIGHT FACTOR '''
-        if self.stim == 'persistent' and self.rescale == True:
-            if np.sum(active_neurons) != len(active_neurons): # and self.p_inh != 1:
-                warnings.warn('Recurrent weights were rescaled.')
-                percent_active = np.sum(active_neurons)/len(active_neurons)
-                self.weight_factor = (1 / percent_active) # if percent_active >= 0.1 else 10 #removed this
\ No newline at end of file
+            P = 1
+        I_E = 0
+        I_I = 0
+    else:
+        raise Exception("Keyword '" + str(input_type) + "' is not a valid type of input drive to the neurons. Please choose 'additive' or 'projection'.")
+    return P, w_E_in, w_I_in, I_E, I_I
+
+def initial_rates(x, sigma, sel_exc_subset, sel_inh_subset):
+    initial_bump_center = sigma # where the bump should start
+    initial_bump_std = sigma    # width of the initial bump
+    
+    # initial rate distribution
+    if np.sum(sel_inh_subset) == len(sel_inh_subset):                 # global inhibition
+        active_neurons = sel_exc_subset
+    elif np.sum(sel_inh_subset) != 0:                                 # selective inhibition
+        active_neurons = 1 - sel_inh_subset
+    elif np.sum(sel_inh_subset) == 0 and np.sum(sel_exc_subset) != 0: # no inhibition, selective excitation
+        active_neurons = sel_exc_subset
+    elif np.sum(sel_inh_subset) == 0 and np.sum(sel_exc_subset) == 0: # no inhibition or excitation
+        active_neurons = 1
+    else:
+        warnings.warn('Something went wrong. Initial rate distribution is not set correctly.')
+     
+    # set initial rate dist
+    initial_r = active_neurons * np.exp(-0.5 * (x - initial_bump_center)**2 / initial_bump_std**2)
+    return initial_bump_center, initial_bump_std, active_neurons, initial_r
+
+def weight_factor(stim, p_inh, rescale, active_neurons):
+    # compute rescaling for the recurrent weights if neurons are silenced
+    #if p_exc != 0 and p_inh != 0:
+    #    raise Exception("Simultaneous selective excitation and inhibition not yet implemented.")
+    #else:
+    
+    if stim == 'transient' and p_inh != 1 and rescale == True:
+        warnings.warn('Recurrent weights were rescaled due to selective inhibition and transient excitatory burst input.')
+        factor = (1 / (1 - p_inh)) #if p_inh <= 0.9 else 10 # removed this
+    #elif stim == 'transient' and p_exc != 1:
+    #    warnings.warn('Recurrent weights were rescaled due to selective excitation and transient excitatory burst input.')
+    #    factor = 1 + 0.15*np.exp(- p_exc)
+    else:
+        factor = 1
+    
+    if stim == 'persistent' and rescale == True:
+        if np.sum(active_neurons) != len(active_neurons): # and p_inh != 1:
+            warnings.warn('Recurrent weights were rescaled.')
+            percent_active = np.sum(active_neurons)/len(active_neurons)
+            factor = (1 / percent_active) # if percent_active >= 0.1 else 10 #removed this
+    return (factor,)
+
+def recording(N, T, record_every, record_start, record_stop, record_neurons):
+    # time steps and neurons that are stored in the activity raster R
+    stop = T if record_stop is None else min(record_stop, T)
+    record_times = np.arange(record_start, stop, record_every)
+    if record_neurons is None:
+        record_index = np.arange(N)
+    else:
+        # a single index stores one neuron, R keeps its (neurons, times) shape
+        record_index = np.atleast_1d(np.arange(N)[np.asarray(record_neurons)])
+    return record_times, record_index
+
+
+# derived parameter graph in evaluation order: function, parameters it reads, parameters it defines
+DERIVED_GRAPH = [
+    Derived(space,              ('N', 'sigma_percent', 'shift_percent'),
+                                ('x', 'sigma', 'shift')),
+    Derived(recurrent_weights,  ('x', 'sigma', '_w_E', '_w_I'),
+                                ('area', 'w_E', 'w_I')),
+    Derived(heterogeneity,      ('N', 'shift', 'sigma', 'shift_jitter_percent', 'sigma_jitter', 'seed'),
+                                ('shifts', 'sigmas')),
+    Derived(selective_subsets,  ('N', 'p_exc', 'p_inh', 'seed'),
+                                ('sel_exc_subset', 'sel_inh_subset')),
+    Derived(external_inputs,    ('type', 'stim', 'p_inh', 'w_E', 'r_E_in', 'r_I_in', 'N_E_in', 'N_I_in', 'sel_exc_subset', 'sel_inh_subset'),
+                                ('P', 'w_E_in', 'w_I_in', 'I_E', 'I_I')),
+    Derived(initial_rates,      ('x', 'sigma', 'sel_exc_subset', 'sel_inh_subset'),
+                                ('initial_bump_center', 'initial_bump_std', 'active_neurons', 'initial_r')),
+    Derived(weight_factor,      ('stim', 'p_inh', 'rescale', 'active_neurons'),
+                                ('weight_factor',)),
+    Derived(recording,          ('N', 'T', 'record_every', 'record_start', 'record_stop', 'record_neurons'),
+                                ('record_times', 'record_index')),
+]
+
+DERIVED_OUTPUTS = {name: node for node in DERIVED_GRAPH for name in node.outputs}
+
+def _resolve_graph():
+    # main parameters each node depends on, directly or through the nodes it reads from
+    for node in DERIVED_GRAPH:
+        base = []
+        for name in node.inputs:
+            upstream = DERIVED_OUTPUTS[name].base if name in DERIVED_OUTPUTS else [name]
+            base += [b for b in upstream if b not in base]
+        node.base = tuple(base)
+
+_resolve_graph()
+
+def clear_cache():
+    for node in DERIVED_GRAPH:
+        node.clear()
+
+
+def activity_shape(keys, setting, defaults=None):
+    '''
+    shape of the stored activity (recorded neurons, recorded time steps) of a parameter setting
+    without computing its derived parameters
+    '''
+    defaults = Parameters() if defaults is None else defaults
+    values = dict(zip(keys, setting))
+    names = ('N', 'T', 'record_every', 'record_start', 'record_stop', 'record_neurons')
+    record_times, record_index = recording(*[values.get(name, getattr(defaults, name)) for name in names])
+    return (len(record_index), len(record_times))
+
+def activity_dtype(keys, setting, defaults=None):
+    defaults = Parameters() if defaults is None else defaults
+    return np.dtype(dict(zip(keys, setting)).get('dtype', defaults.dtype))
@@ -1,75 +1,220 @@
 # Copyright 2023 Andrew Lehr
 # The MIT License
 
+import os
+import functools
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+
+'''
+large rasters and weight matrices are reduced to the pixel grid of the figure before drawing.
+Each pixel bin keeps its minimum and its maximum (two rows or columns per bin), so single
+spikes and the bump edges survive the reduction, imshow only ever sees ~2 x pixels values
+'''
+
+def _edges(n, bins):
+    return np.linspace(0, n, bins + 1).astype(int)[:-1]
+
+def decimate(R, shape):
+    '''
+    min/max decimation of a 2d array to at most 2 * shape, axes shorter than that (or with
+    None in shape) are kept. Works on memory-mapped arrays, each axis is reduced in one pass,
+    columns first
+    '''
+    for axis in reversed(range(len(shape))):
+        n, bins = R.shape[axis], shape[axis]
+        if bins is None or n <= 2 * bins:
+            continue
+        starts = _edges(n, bins)
+        low = np.minimum.reduceat(R, starts, axis=axis)
+        high = np.maximum.reduceat(R, starts, axis=axis)
+        R = np.stack((low, high), axis=axis + 1).reshape(low.shape[:axis] + (2 * bins,) + low.shape[axis + 1:])
+    return np.asarray(R)
+
+def weight_rows(net, columns=None):
+    '''
+    function rows(a, b) returning rows a to b of the weight matrix of a network, decimated to
+    columns bins like decimate (None keeps every column). Built from the kernel (circulant) or
+    from the sparse matrix, W itself is never materialized
+    '''
+    net._check_connectivity()
+    N = net.params.N
+    if net.weights is None:
+        E = net.operator().E.tocsr()
+        inhibition = net.operator().inhibition
+        return lambda a, b: decimate(E[a:b].toarray() - inhibition, (None, columns))
+    weights = net.weights
+    if columns is None or N <= 2 * columns:
+        return lambda a, b: weights[(np.arange(a, b)[:, None] - np.arange(N)[None, :]) % N]
+
+    # row j of a column bin [c, d) holds weights[(j - d + 1) % N] ... weights[(j - c) % N], a
+    # circular window of d - c kernel entries, so min and max of every window length are
+    # tabulated once and each decimated row is a gather from the tables
+    ends = np.append(_edges(N, columns)[1:], N)
+    widths, width_index = np.unique(np.diff(np.append(0, ends)), return_inverse=True)
+    windows = [np.lib.stride_tricks.sliding_window_view(np.concatenate((weights, weights)), width)[:N] for width in widths]
+    low = np.array([window.min(axis=1) for window in windows])
+    high = np.array([window.max(axis=1) for window in windows])
+    def rows(a, b):
+        start = (np.arange(a, b)[:, None] + 1 - ends[None, :]) % N
+        image = np.empty((b - a, 2 * columns), dtype=weights.dtype)
+        image[:, 0::2] = low[width_index[None, :], start]
+        image[:, 1::2] = high[width_index[None, :], start]
+        return image
+    return rows
+
+def decimated_weights(net, shape, tile=2**22):
+    '''
+    weight matrix of a network decimated to shape, equal to decimate(net.W, shape), assembled
+    from weight_rows in blocks of at most tile entries
+    '''
+    rows = weight_rows(net, shape[1])
+    N = net.params.N
+    step = max(1, tile // N)
+    if N <= 2 * shape[0]:
+        return np.concatenate([rows(a, min(a + step, N)) for a in range(0, N, step)])
+
+    image = []
+    starts = list(_edges(N, shape[0])) + [N]
+    for a, b in zip(starts[:-1], starts[1:]):
+        # one output bin of rows, reduced in blocks of step rows
+        low, high = None, None
+        for c in range(a, b, step):
+            block = rows(c, min(c + step, b))
+            low = block.min(axis=0) if low is None else np.minimum(low, block.min(axis=0))
+            high = block.max(axis=0) if high is None else np.maximum(high, block.max(axis=0))
+        image += [low, high]
+    return np.array(image)
+
 
 class Plot:
-    def __init__(self):
+    def __init__(self, show=True, dpi=100):
         self.tick_size = 13
         self.label_size = 16
-        
+        self.show = show      # call plt.show, otherwise figures are drawn off-screen (Agg) and closed after saving
+        self.dpi = dpi        # resolution the rasters are decimated to
+
+    def _figure(self, figsize=None):
+        if self.show:
+            return plt.subplots(figsize=figsize)
+        # headless, independent of the pyplot backend and safe in worker processes
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot()
+
+    def _pixels(self, fig):
+        width, height = fig.get_size_inches() * self.dpi
+        return int(height), int(width)
+
+    def _finish(self, fig, storage_loc):
+        if storage_loc != None:
+            fig.savefig(storage_loc, bbox_inches="tight", dpi=self.dpi if not self.show else 'figure')
+        if self.show:
+            plt.show()
+
     def weight_matrix(self, W, storage_loc=None, tick_sep=200):
-        fig, ax = plt.subplots()
-        im = ax.imshow(W, cmap='Greys')
-        cb = plt.colorbar(im)
+        '''
+        W is the dense weight matrix or a RingNetwork, whose weights are then drawn from the
+        kernel tile by tile without building the N x N matrix
+        '''
+        fig, ax = self._figure()
+        if hasattr(W, 'params'):
+            N = W.params.N
+            image = decimated_weights(W, self._pixels(fig))
+        else:
+            N = np.shape(W)[0]
+            image = decimate(W, self._pixels(fig))
+        im = ax.imshow(image, cmap='Greys', extent=(-0.5, N - 0.5, N - 0.5, -0.5))
+        cb = fig.colorbar(im, ax=ax)
         cb.ax.tick_params(labelsize=self.tick_size)
-        plt.xticks(np.arange(0,np.shape(W)[1]+1,tick_sep), fontsize=self.tick_size)
-        plt.yticks(np.arange(0,np.shape(W)[0]+1,tick_sep), fontsize=self.tick_size)
-        plt.xlabel('source', fontsize=self.label_size)
-        plt.ylabel('target', fontsize=self.label_size)
-        
-        if storage_loc != None:
-            plt.savefig(storage_loc, bbox_inches="tight")
-        
-        plt.show()
-        
-        
+        if N // tick_sep <= 10:
+            # otherwise matplotlib places the ticks, thousands of them would make rendering slow
+            ax.set_xticks(np.arange(0,N+1,tick_sep))
+            ax.set_yticks(np.arange(0,N+1,tick_sep))
+        ax.tick_params(labelsize=self.tick_size)
+        ax.set_xlabel('source', fontsize=self.label_size)
+        ax.set_ylabel('target', fontsize=self.label_size)
+
+        self._finish(fig, storage_loc)
+
+
     def activity_raster(self, R, storage_loc=None, figsize=(6,3), title=None, xlabel='time step', interpolation='gaussian'):
-        fig, ax = plt.subplots(figsize=figsize)
-        im = ax.imshow(R, aspect='auto', cmap='Greys', origin='lower', interpolation=interpolation)
-        cb = plt.colorbar(im)
+        fig, ax = self._figure(figsize=figsize)
+        N, T = np.shape(R)
+        im = ax.imshow(decimate(R, self._pixels(fig)), aspect='auto', cmap='Greys', origin='lower',
+                       interpolation=interpolation, extent=(-0.5, T - 0.5, -0.5, N - 0.5))
+        cb = fig.colorbar(im, ax=ax)
         cb.ax.tick_params(labelsize=self.tick_size)
         cb.ax.get_yaxis().labelpad = 15
         cb.ax.set_ylabel('firing rate', fontsize=15)
-        plt.xlim(0,)
-        plt.xticks(fontsize=17)
-        plt.yticks(fontsize=17)
-        plt.xlabel(xlabel, fontsize=18)
-        plt.ylabel('neuron', fontsize=18)
-        
+        ax.set_xlim(0,)
+        ax.tick_params(labelsize=17)
+        ax.set_xlabel(xlabel, fontsize=18)
+        ax.set_ylabel('neuron', fontsize=18)
+
         if title != None:
-            plt.title(title, fontsize=18)
-        
-        if storage_loc != None:
-            plt.savefig(storage_loc, bbox_inches="tight")
-        
-        plt.show()
-        
-        
+            ax.set_title(title, fontsize=18)
+
+        self._finish(fig, storage_loc)
+
+
     def eigenspectrum(self, evals, storage_loc=None, figsize=(4,4), color='black', alpha=0.7, ylim=1.6, xlim=1.9, title=None):
-        fig, ax = plt.subplots(figsize=figsize)
+        fig, ax = self._figure(figsize=figsize)
 
         # eigenvalues of weight matrix, W
-        plt.scatter(evals.real, 
-                    evals.imag, s=120, color=color, alpha=alpha)
+        ax.scatter(evals.real,
+                   evals.imag, s=120, color=color, alpha=alpha)
 
         # formatting plot
-        plt.xlabel('real part', fontsize=self.label_size)
-        plt.ylabel('imaginary part', fontsize=self.label_size)
+        ax.set_xlabel('real part', fontsize=self.label_size)
+        ax.set_ylabel('imaginary part', fontsize=self.label_size)
         ax.tick_params(axis='both', which='major', labelsize=self.tick_size)
         ax.spines['top'].set_visible(False)
         ax.spines['right'].set_visible(False)
         ax.spines['bottom'].set_position('center')
 
-        plt.grid(alpha=0.4)
-        plt.ylim(-ylim, ylim)
-        plt.xlim(-0.1, xlim)
+        ax.grid(alpha=0.4)
+        ax.set_ylim(-ylim, ylim)
+        ax.set_xlim(-0.1, xlim)
         #plt.legend(fontsize=labelsize, frameon=False)
 
         if title != None:
-            plt.title(title)
-        
-        if storage_loc != None:
-            plt.savefig(storage_loc, bbox_inches="tight")
-        plt.show()
\ No newline at end of file
+            ax.set_title(title)
+
+        self._finish(fig, storage_loc)
+
+
+def _export_rasters(exp_data_dir, counters, directory, file_format, dpi):
+    # worker: every process opens the experiment itself, only counters and file names are exchanged
+    from ..utils import DataManager
+    data = DataManager(exp_data_dir)
+    plot = Plot(show=False, dpi=dpi)
+    names = []
+    for counter in counters:
+        setting = data.param_space[counter]
+        name = directory + 'activity_' + str(counter) + '.' + file_format
+        plot.activity_raster(data.load_activity(setting), storage_loc=name, title=str(dict(zip(data.keys, setting))))
+        names.append(name)
+    return names
+
+def export_rasters(exp_data_dir, directory=None, settings=None, workers=None, chunksize=8, file_format='png', dpi=100):
+    '''
+    activity rasters of a whole sweep saved without a display, one file per setting named by its
+    counter, rendered in a process pool. directory defaults to figures/ in the experiment folder
+    '''
+    from ..utils import DataManager
+    data = DataManager(exp_data_dir)
+    directory = data.exp_dir + 'figures/' if directory is None else directory
+    os.makedirs(directory, exist_ok=True)
+    counters = list(range(len(data.param_space))) if settings is None else [data.index[tuple(setting)] for setting in settings]
+    chunks = [counters[i:i+chunksize] for i in range(0, len(counters), chunksize)]
+
+    names = []
+    export = functools.partial(_export_rasters, exp_data_dir, directory=directory, file_format=file_format, dpi=dpi)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_names in pool.map(export, chunks):
+            names += chunk_names
+    return names
@@ -0,0 +1,120 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+'''
+eigendecomposition of the recurrent weights that exploits their structure
+
+global inhibition: W[j, i] = weights[(j - i) % N] is circulant, its eigenvectors are the Fourier
+modes and its eigenvalues are the DFT of the kernel, so the whole spectrum costs one FFT
+
+selective inhibition (projection): the rows of diag(P) @ W of inhibited neurons are zero. Ordering
+the active neurons A first gives the block matrix [[W_AA, W_AI], [0, 0]], so the nonzero eigenvalues
+are those of W_AA and the eigenvectors are those of W_AA padded with zeros on the inhibited neurons
+
+sparse (heterogeneous) connectivity has no such structure, its spectrum comes from ARPACK with
+the sparse product, or from a dense solver for small N
+'''
+
+def circulant_eigenvalues(weights):
+    # eigenvalue of Fourier mode k, v_k[j] = exp(2 pi i j k / N) / sqrt(N)
+    return np.fft.fft(weights)
+
+def circulant_eigenvectors(N, modes):
+    j = np.arange(N)[:, None]
+    return np.exp(2j * np.pi * j * np.asarray(modes)[None, :] / N) / np.sqrt(N)
+
+def dominant_frequency(eigenvectors):
+    '''
+    spatial frequency (cycles around the ring) with the largest power, per eigenvector column
+    '''
+    N = eigenvectors.shape[0]
+    k = np.argmax(np.abs(np.fft.fft(eigenvectors, axis=0)), axis=0)
+    return np.minimum(k, N - k)
+
+def _largest(eigenvalues, k):
+    order = np.argsort(-np.abs(eigenvalues), kind='stable')
+    return order if k is None else order[:k]
+
+def circulant_spectrum(weights, k=None):
+    N = len(weights)
+    eigenvalues = circulant_eigenvalues(weights)
+    modes = _largest(eigenvalues, k)
+    return {'eigenvalues': eigenvalues[modes],
+            'eigenvectors': circulant_eigenvectors(N, modes),
+            'frequencies': np.minimum(modes, N - modes)}
+
+def projected_spectrum(weights, P, k=None, dense_limit=2000):
+    '''
+    spectrum of diag(P) @ W for a 0/1 projection vector P, the k eigenvalues of largest
+    magnitude (all if k is None). Uses a dense solver on W_AA for small active sets and
+    ARPACK with a matrix-free W_AA (one FFT per product) otherwise
+    '''
+    N = len(weights)
+    if np.all(np.asarray(P) == 1):
+        return circulant_spectrum(weights, k)
+
+    active = np.flatnonzero(np.broadcast_to(P, (N,)))
+    n = len(active)
+    if n == 0:
+        return {'eigenvalues': np.zeros(0, dtype=complex),
+                'eigenvectors': np.zeros((N, 0), dtype=complex),
+                'frequencies': np.zeros(0, dtype=int)}
+
+    if k is None or k >= n - 1 or n <= dense_limit:
+        # W_AA[a, b] = weights[(active[a] - active[b]) % N]
+        W_AA = weights[(active[:, None] - active[None, :]) % N]
+        eigenvalues, vectors = np.linalg.eig(W_AA)
+        order = _largest(eigenvalues, k)
+        eigenvalues, vectors = eigenvalues[order], vectors[:, order]
+    else:
+        from scipy.sparse.linalg import LinearOperator, eigs
+        kernel_fft = np.fft.rfft(weights)
+        def matvec(x):
+            full = np.zeros(N)
+            full[active] = np.real(np.ravel(x))
+            return np.fft.irfft(kernel_fft * np.fft.rfft(full), n=N)[active]
+        def matvec_complex(x):
+            x = np.ravel(x)
+            return matvec(x.real) + 1j * matvec(x.imag) if np.iscomplexobj(x) else matvec(x)
+        operator = LinearOperator((n, n), matvec=matvec_complex, dtype=float)
+        eigenvalues, vectors = eigs(operator, k=k, which='LM')
+        order = _largest(eigenvalues, None)
+        eigenvalues, vectors = eigenvalues[order], vectors[:, order]
+
+    eigenvectors = np.zeros((N, len(eigenvalues)), dtype=complex)
+    eigenvectors[active] = vectors
+    return {'eigenvalues': eigenvalues,
+            'eigenvectors': eigenvectors,
+            'frequencies': dominant_frequency(eigenvectors)}
+
+def sparse_spectrum(operator, P, k=None, dense_limit=2000):
+    '''
+    spectrum of diag(P) @ W for a SparseOperator W, the k eigenvalues of largest magnitude
+    '''
+    N = operator.N
+    P = np.broadcast_to(np.asarray(P, dtype=float), (N,))
+    if k is None or k >= N - 1 or N <= dense_limit:
+        eigenvalues, eigenvectors = np.linalg.eig(P[:, None] * operator.toarray())
+        order = _largest(eigenvalues, k)
+    else:
+        from scipy.sparse.linalg import LinearOperator, eigs
+        def matvec(x):
+            x = np.ravel(x)
+            return P * operator.matvec(x.real) + 1j * P * operator.matvec(x.imag) if np.iscomplexobj(x) else P * operator.matvec(x)
+        eigenvalues, eigenvectors = eigs(LinearOperator((N, N), matvec=matvec, dtype=float), k=k, which='LM')
+        order = _largest(eigenvalues, None)
+    eigenvectors = eigenvectors[:, order].astype(complex)
+    return {'eigenvalues': eigenvalues[order].astype(complex),
+            'eigenvectors': eigenvectors,
+            'frequencies': dominant_frequency(eigenvectors)}
+
+def spectrum(net, k=None, dense_limit=2000):
+    '''
+    spectrum of the effective recurrent matrix of a network, diag(P) @ W
+    '''
+    net._check_connectivity()
+    if net.weights is None:
+        return sparse_spectrum(net.operator(), net.params.P, k, dense_limit)
+    return projected_spectrum(net.weights, net.params.P, k, dense_limit)
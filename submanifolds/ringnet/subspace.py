@@ -0,0 +1,83 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+'''
+principal components of population activity and principal angles between the subspaces
+of different settings. Activity R has shape (N, T), neurons are the dimensions of the state
+space and time steps are the samples
+'''
+
+def _randomized_svd(X, k, oversample=10, n_iter=7, seed=0):
+    # Halko, Martinsson, Tropp: range finder with power iterations, then an exact SVD of the small projection
+    rng = np.random.RandomState(seed)
+    Q = rng.standard_normal((X.shape[1], min(k + oversample, min(X.shape))))
+    Q, _ = np.linalg.qr(X @ Q)
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(X.T @ Q)
+        Q, _ = np.linalg.qr(X @ Q)
+    U, s, _ = np.linalg.svd(Q.T @ X, full_matrices=False)
+    return (Q @ U)[:, :k], s[:k]
+
+def pca(R, k=10, chunk=None, oversample=10, n_iter=7, seed=0):
+    '''
+    first k principal components of R (N, T)
+
+    chunk:  if given, R is streamed in windows of chunk time steps (e.g. a memory-mapped raster)
+            and only the N x N covariance is kept in memory, otherwise a randomized truncated SVD
+            of the centered activity is used
+
+    returns the components (N, k), their explained variance and explained variance ratio and the mean
+    '''
+    N, T = R.shape
+    k = min(k, N, T)
+
+    if chunk is None:
+        mean = np.mean(R, axis=1)
+        X = R - mean[:, None]
+        total = np.sum(X**2) / max(T - 1, 1)
+        components, s = _randomized_svd(X, k, oversample, n_iter, seed)
+        variance = s**2 / max(T - 1, 1)
+    else:
+        # first pass over time for the mean, second for the covariance, both chunked
+        mean = np.zeros(N)
+        for start in range(0, T, chunk):
+            mean += np.sum(R[:, start:start+chunk], axis=1)
+        mean /= T
+        covariance = np.zeros((N, N))
+        for start in range(0, T, chunk):
+            X = R[:, start:start+chunk] - mean[:, None]
+            covariance += X @ X.T
+        covariance /= max(T - 1, 1)
+        total = np.trace(covariance)
+        variance, components = np.linalg.eigh(covariance)
+        variance, components = variance[::-1][:k], components[:, ::-1][:, :k]
+
+    return {'components': components,
+            'explained_variance': variance,
+            'explained_variance_ratio': variance / total if total > 0 else np.zeros_like(variance),
+            'mean': mean}
+
+def principal_angles(bases, others=None):
+    '''
+    principal angles (radians, ascending) between every pair of subspaces
+
+    bases:  (S, N, k) stack of orthonormal bases, e.g. pca components of S settings
+    others: optional (S', N, k') stack, default compares bases with themselves
+
+    all pairwise cross products come from one (S k) x (S' k') matrix product, the angles are the
+    arccos of the singular values of each k x k' block, returns an (S, S', min(k, k')) array
+    '''
+    bases = np.asarray(bases)
+    others = bases if others is None else np.asarray(others)
+    S, N, k = bases.shape
+    S_o, _, k_o = others.shape
+
+    A = bases.transpose(0, 2, 1).reshape(S * k, N)
+    B = others.transpose(1, 0, 2).reshape(N, S_o * k_o)
+    blocks = (A @ B).reshape(S, k, S_o, k_o).transpose(0, 2, 1, 3)
+
+    cosines = np.linalg.svd(blocks, compute_uv=False)
+    # singular values come in descending order, so the angles are ascending
+    return np.arccos(np.clip(cosines, -1, 1))
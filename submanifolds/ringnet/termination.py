@@ -0,0 +1,121 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+class SteadyStateDetector:
+    '''
+    detects when the dynamics of RingNetwork.run stop producing anything new
+
+    extinction:  all rates are zero up to atol times the largest rate seen so far, and the inputs cannot bring them back
+    fixed point: r(t+1) = g r(t)
+    travelling:  r(t+1) = g roll(r(t), s), a bump moving at constant speed
+    periodic:    r(t+1) = g roll(r(t+1-p), s) for a period 1 < p <= max_period
+
+    the factor g compares the shapes independently of their scale, so a bump that decays or grows
+    geometrically is steady as well (g = 1 for a state that is steady in the usual sense). Each
+    condition has to hold within the relative tolerance for `patience` consecutive steps, the
+    tolerances are never finer than the precision of params.dtype
+    '''
+    def __init__(self, params, P, drive):
+        self.eps = np.finfo(params.dtype).eps
+        self.tol = max(params.adaptive_tol, 4 * self.eps)
+        self.atol = max(params.adaptive_atol, self.eps)
+        self.patience = params.adaptive_patience
+        self.max_period = params.adaptive_max_period
+        self.N = params.N
+        # last max_period states in a ring buffer, with their largest absolute rate and their sum
+        self.history = np.zeros((self.max_period, self.N), dtype=params.dtype)
+        self.scales = np.zeros(self.max_period)
+        self.sums = np.zeros(self.max_period)
+        self.steps = 0               # number of states stored so far
+        self.next_scale = None       # scale and sum of r_next of the previous call, the next r
+        self.next_sum = None
+        self.candidate = None        # (period, shift) seen in the previous steps
+        self.factor = None           # and its factor
+        self.count = 0
+        self.extinct = 0             # consecutive steps below the extinction threshold
+        self.peak = 0.0              # largest rate seen so far
+        # zero rates stay zero if the rectified input alone is zero everywhere
+        self.absorbing_zero = np.all(np.asarray(P * drive) <= 0)
+
+    def _matches(self, r_next, previous, shift, factor, scale):
+        # r_next against factor * roll(previous, shift), compared in the two pieces of the roll
+        # instead of building the rolled copy
+        limit = self.tol * scale
+        n = self.N - shift
+        if np.abs(r_next[shift:] - factor * previous[:n]).max() > limit:
+            return False
+        return shift == 0 or np.abs(r_next[:shift] - factor * previous[n:]).max() <= limit
+
+    def check(self, r, r_next):
+        '''
+        called with the state r at step t and the next state, returns None or (reason, period, shift, factor).
+        Consecutive calls have to pass consecutive states
+        '''
+        # run reuses its state buffers, keep a copy
+        index = self.steps % self.max_period
+        np.copyto(self.history[index], r)
+        if self.steps == 0:
+            self.next_scale, self.next_sum = float(np.max(np.abs(r))), float(np.sum(r))
+        self.scales[index], self.sums[index] = self.next_scale, self.next_sum
+        self.steps += 1
+
+        scale = float(np.abs(r_next).max())
+        total = float(r_next.sum())
+        self.next_scale, self.next_sum = scale, total
+        self.peak = max(self.peak, self.scales[index], scale)
+        if self.absorbing_zero and scale <= self.atol * self.peak:
+            self.extinct += 1
+            self.candidate, self.count = None, 0
+            return ('extinction', 1, 0, 0.0) if self.extinct >= self.patience else None
+        self.extinct = 0
+
+        # a match within tol * scale at every neuron bounds the difference of the sums (which the
+        # roll does not change) by N tol scale, up to the rounding of the sums. Only states passing
+        # this test are rolled and compared neuron by neuron
+        sum_tol = self.N * (self.tol + 2 * self.N * self.eps) * scale
+        found = None
+        for period in range(1, min(self.steps, self.max_period) + 1):
+            previous_index = (self.steps - period) % self.max_period
+            previous_scale = self.scales[previous_index]
+            if previous_scale == 0:
+                continue
+            factor = scale / previous_scale
+            if abs(total - factor * self.sums[previous_index]) > sum_tol:
+                continue
+            previous = self.history[previous_index]
+            # shift estimated from the peaks, then verified on the whole profile
+            shift = int(r_next.argmax() - previous.argmax()) % self.N
+            if self._matches(r_next, previous, shift, factor, scale):
+                found = (period, shift)
+                break
+
+        if found is None or found != self.candidate or abs(factor - self.factor) > self.tol * max(factor, self.factor):
+            self.candidate = found
+            self.factor = factor if found is not None else None
+            self.count = 1 if found is not None else 0
+        else:
+            self.count += 1
+
+        if found is None or self.count < self.patience:
+            return None
+
+        period, shift = found
+        if period == 1:
+            reason = 'fixed_point' if shift == 0 else 'travelling'
+        else:
+            reason = 'periodic'
+        return reason, period, shift, factor
+
+    def extend(self, r_next, period, shift, factor=1.0):
+        '''
+        states after r_next, generated by rolling the state one period earlier and scaling it by factor
+        '''
+        states = [np.array(self.history[(self.steps - p) % self.max_period]) for p in range(period - 1, 0, -1)]
+        states.append(np.array(r_next))
+        while True:
+            r = factor * np.roll(states[0], shift)
+            states.append(r)
+            states.pop(0)
+            yield r
@@ -2,4 +2,8 @@
 # The MIT License
 
 from .load import DataManager
-from .get_root import get_root
\ No newline at end of file
+from .get_root import get_root
+from .store import ArrayStore
+from .cache import ResultCache
+from .profile import Profiler
+from .writer import BackgroundWriter
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import os
+import os.path as path
+import glob
+import hashlib
+import tempfile
+import _pickle as cPickle
+import numpy as np
+from . import profile
+
+def code_salt():
+    '''
+    hash of the simulation code, cached results are invalidated when the code changes
+    '''
+    ringnet_dir = path.abspath(path.join(__file__, "../../ringnet")) + '/'
+    digest = hashlib.sha256()
+    for name in sorted(glob.glob(ringnet_dir + '*.py')):
+        with open(name, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def _normalize(value):
+    # stable text form of a parameter value, numpy scalars and python numbers hash alike
+    if isinstance(value, np.ndarray):
+        return repr(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        return repr([_normalize(v) for v in value])
+    return repr(value)
+
+
+class ResultCache:
+    '''
+    content-addressed store of simulation results, shared between experiments and runs
+
+    an entry is keyed by a hash of the full effective parameter set (every main parameter and
+    derived parameter overrides, not just the iterated ones), the run options and a salt of the
+    simulation code, so a widened grid or a restarted sweep finds every point computed before.
+    Entries are written atomically as soon as a setting finishes and the oldest used entries
+    are evicted once the cache grows beyond max_bytes. The size is tracked as a running total,
+    the directory is only scanned again when the total exceeds max_bytes (entries written by other
+    processes sharing the cache are counted from that scan on)
+    '''
+    def __init__(self, directory=None, max_bytes=10 * 2**30, salt=None):
+        if directory is None:
+            directory = path.abspath(path.join(__file__ ,"../../../..")) + '/data/cache/'
+        self.directory = directory if directory.endswith('/') else directory + '/'
+        self.max_bytes = max_bytes
+        self.salt = code_salt() if salt is None else salt
+        self.total = None    # estimated size of the entries in bytes, None until the first put
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def options(observers=None, record=None):
+        '''
+        run options that change the stored result: which observers ran and whether the raster was kept
+        '''
+        observers = [] if observers is None else list(observers)
+        record = record if record is not None else len(observers) == 0
+        return (record, [(type(observer).__name__, sorted(vars(observer).items())) for observer in observers])
+
+    def key(self, params, options=None):
+        items = [(name, getattr(params, name)) for name in params._base]
+        items += [('override:' + name, value) for name, value in sorted(params._overrides.items())]
+        text = ';'.join(name + '=' + _normalize(value) for name, value in items)
+        text += '|' + repr(options) + '|' + self.salt
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _file(self, key):
+        return self.directory + key + '.pkl'
+
+    def __contains__(self, key):
+        return path.isfile(self._file(key))
+
+    def get(self, key):
+        name = self._file(key)
+        try:
+            with profile.phase('cache'), open(name, "rb") as f:
+                result = cPickle.load(f)
+        except (FileNotFoundError, EOFError):
+            return None
+        # modification time records the last use, see evict
+        try:
+            os.utime(name)
+        except FileNotFoundError:
+            pass
+        return result
+
+    def put(self, key, result):
+        # write to a temporary file in the same directory, then rename, a crash never leaves a partial entry
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with profile.phase('cache'), os.fdopen(handle, "wb") as f:
+                cPickle.dump(result, f)
+                f.flush()
+                os.fsync(f.fileno())
+            size = path.getsize(temporary)
+            replaced = path.getsize(self._file(key)) if key in self else 0
+            os.replace(temporary, self._file(key))
+        except BaseException:
+            if path.exists(temporary):
+                os.remove(temporary)
+            raise
+        if self.max_bytes is not None:
+            if self.total is None:
+                self.total = self.size()
+            else:
+                self.total += size - replaced
+            if self.total > self.max_bytes:
+                self.evict()
+
+    def size(self):
+        return sum(path.getsize(name) for name in glob.glob(self.directory + '*.pkl'))
+
+    def evict(self):
+        '''
+        remove least recently used entries until the cache fits into max_bytes
+        '''
+        entries = []
+        for name in glob.glob(self.directory + '*.pkl'):
+            try:
+                entries.append((path.getmtime(name), path.getsize(name), name))
+            except FileNotFoundError:
+                pass
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total = total
+
+    def clear(self):
+        for name in glob.glob(self.directory + '*.pkl'):
+            os.remove(name)
+        self.total = 0
@@ -2,19 +2,25 @@
 # The MIT License
 
 import os
-import os.path as path
+import numpy as np
 import _pickle as cPickle
+from .store import ArrayStore, select
+from . import profile
+from .writer import load_pickle
+from .get_root import get_root
 
 class DataManager:
     def __init__(self, exp_data_dir):
-        self.root = path.abspath(path.join(__file__ ,"../../../..")) + '/'
+        self.root = get_root()
         self.data_dir = self.root + 'data/'
         self.exp_dir = self.data_dir + exp_data_dir + '/'
         self.meta_dir = self.exp_dir + 'metadata/'
         self.sim_dir = self.exp_dir + 'simulation/'  
         self.eig_dir = self.exp_dir + 'eigendecomposition/' 
         self.bump_dir = self.exp_dir + 'bump_statistics/' 
+        self.ens_dir = self.exp_dir + 'ensemble/'
         self.load_metadata()
+        self.store = ArrayStore(self.sim_dir).open(self.param_space) if ArrayStore.exists(self.sim_dir) else None
     
     def load_metadata(self):
         with open(self.meta_dir + 'param_space.pkl', "rb") as f:
@@ -25,17 +31,60 @@ class DataManager:
             self.params_to_iterate = cPickle.load(f)
         with open(self.meta_dir + 'keys.pkl', "rb") as f:
             self.keys = cPickle.load(f)
+        
+        # hash index from parameter setting to file counter, O(1) lookup
+        self.index = {tuple(setting): counter for counter, setting in enumerate(self.param_space)}
     
     def load_data(self, parameter_setting):
-        filename = self.param_space.index(parameter_setting)
-        name = self.sim_dir + str(filename) + '.pkl'
-        with open(name, "rb") as f:
-            return cPickle.load(f)
+        with profile.phase('load'):
+            if self.store is not None:
+                return self.load_network(parameter_setting)
+            filename = self.index[tuple(parameter_setting)]
+            name = self.sim_dir + str(filename) + '.pkl'
+            return load_pickle(name)
+        
+    def load_network(self, parameter_setting):
+        # array store keeps only activity, the network is rebuilt from its parameters
+        from ..ringnet import Parameters, RingNetwork
+        net = RingNetwork(Parameters({'keys': self.keys, 'setting': parameter_setting}))
+        net._build()
+        net.R = self.store.activity(parameter_setting)
+        return net
+    
+    def load_activity(self, parameter_setting, neurons=slice(None), times=slice(None)):
+        '''
+        activity of one setting, restricted to neurons and times. Zero-copy view into the
+        memory-mapped store for slices, legacy pickles are loaded and sliced
+        '''
+        with profile.phase('load'):
+            if self.store is not None:
+                return self.store.activity(parameter_setting, neurons, times)
+            return select(self.load_data(parameter_setting).R, neurons, times)
+    
+    def load_activity_bulk(self, parameter_settings, neurons=slice(None), times=slice(None)):
+        if self.store is not None:
+            return self.store.activity_bulk(parameter_settings, neurons, times)
+        return np.stack([self.load_activity(setting, neurons, times) for setting in parameter_settings])
+        
+    def load_statistics(self, parameter_setting):
+        filename = self.index[tuple(parameter_setting)]
+        name = self.bump_dir + str(filename) + '.pkl'
+        with profile.phase('load'):
+            return load_pickle(name)
+        
+    def load_ensemble(self, parameter_setting):
+        '''
+        summary of an EnsembleExperiment setting: size, and running moments (mean, variance,
+        confidence_interval, ...) of the activity, the observer statistics and the subspace
+        '''
+        filename = self.index[tuple(parameter_setting)]
+        name = self.ens_dir + str(filename) + '.pkl'
+        with profile.phase('load'):
+            return load_pickle(name)
         
     def load(self, filename, location):
         name = str(location) + str(filename) + '.pkl'
-        with open(name, "rb") as f:
-            return cPickle.load(f)
+        return load_pickle(name)
         
     def save(self, data, filename, location):
         name = str(location) + str(filename) + '.pkl'
@@ -0,0 +1,152 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+'''
+instrumentation of the simulation pipeline
+
+the code calls phase(name) around the steps worth timing (parameters, connect, weight_matrix,
+run, save, load, ...) and count(name, value) for counters (steps, rectified neurons, bytes).
+Both only record while a Profiler is active, otherwise phase returns one shared no-op context
+and count returns immediately, so instrumentation that is switched off costs a function call
+
+    with Profiler() as profiler:
+        experiment.iterate()
+    profiler.report()
+    profiler.to_chrome_trace('trace.json')   # chrome://tracing or https://ui.perfetto.dev
+'''
+
+_active = None
+_null = contextlib.nullcontext()
+
+def active():
+    return _active
+
+def phase(name):
+    if _active is None:
+        return _null
+    return _active.phase(name)
+
+def count(name, value=1):
+    if _active is not None:
+        _active.count(name, value)
+
+
+class Profiler:
+    '''
+    timings of named phases and counters, aggregated over everything that ran while it was active
+
+    totals:   name -> [calls, seconds], phases nested in other phases are counted in both
+    counters: name -> summed value
+    events:   (name, start, duration, process, thread) of the first max_events phases, for traces
+
+    phases and counters can be recorded from several threads at once (the BackgroundWriter saves
+    while the main thread runs), the records are only changed while holding the profiler's lock
+    '''
+    def __init__(self, max_events=100000):
+        self.totals = {}
+        self.counters = {}
+        self.events = []
+        self.max_events = max_events
+        self._previous = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        global _active
+        self._previous.append(_active)
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        _active = self._previous.pop() if self._previous else None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - begin
+            with self._lock:
+                total = self.totals.setdefault(name, [0, 0.0])
+                total[0] += 1
+                total[1] += duration
+                if len(self.events) < self.max_events:
+                    self.events.append((name, start, duration, os.getpid(), threading.get_ident()))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        '''
+        add the records of another profiler, e.g. one that ran in a worker process
+        '''
+        with self._lock:
+            for name, (calls, seconds) in other.totals.items():
+                total = self.totals.setdefault(name, [0, 0.0])
+                total[0] += calls
+                total[1] += seconds
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.events += other.events[:max(self.max_events - len(self.events), 0)]
+        return self
+
+    def __getstate__(self):
+        # sent back from worker processes, the stack of enclosing profilers and the lock stay behind
+        state = self.__dict__.copy()
+        state['_previous'] = []
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def report(self):
+        '''
+        structured summary: per phase calls, total and mean seconds, and the counters
+        '''
+        with self._lock:
+            totals = [(name, calls, seconds) for name, (calls, seconds) in self.totals.items()]
+            counters = dict(self.counters)
+        phases = {name: {'calls': calls, 'seconds': seconds, 'mean_seconds': seconds / calls}
+                  for name, calls, seconds in sorted(totals, key=lambda item: -item[2])}
+        return {'phases': phases, 'counters': counters}
+
+    def to_json(self, filename):
+        with open(filename, 'w') as f:
+            # counters may be numpy scalars
+            json.dump(self.report(), f, indent=2, default=lambda value: value.item())
+
+    def to_chrome_trace(self, filename):
+        # trace event format, complete events with microsecond timestamps
+        with self._lock:
+            recorded, counters = list(self.events), dict(self.counters)
+        events = [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': process, 'tid': thread}
+                  for name, start, duration, process, thread in recorded]
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'counters': counters}}, f,
+                      default=lambda value: value.item())
+
+    def __str__(self):
+        report = self.report()
+        lines = ['%-20s %8s %12s %12s' % ('phase', 'calls', 'seconds', 'mean')]
+        for name, entry in report['phases'].items():
+            lines.append('%-20s %8d %12.4f %12.6f' % (name, entry['calls'], entry['seconds'], entry['mean_seconds']))
+        for name, value in report['counters'].items():
+            lines.append('%-20s %8s %12s' % (name, '', value))
+        return '\n'.join(lines)
@@ -0,0 +1,157 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import os.path as path
+import _pickle as cPickle
+import numpy as np
+
+def select(R, neurons=slice(None), times=slice(None)):
+    '''
+    R[neurons, times] in one indexing step, so an int selector drops its axis instead of breaking
+    the second index. Two index arrays select the outer product, as two slices would
+    '''
+    if np.ndim(neurons) == 1 and np.ndim(times) == 1:
+        return R[np.ix_(neurons, times)]
+    return R[neurons, times]
+
+class ArrayStore:
+    '''
+    columnar storage for the activity of a sweep, replaces one pickle per network
+
+    settings with the same (N, T) share one preallocated, memory-mappable array file
+    activity_<N>x<T>.npy of shape (settings, N, T). The parameter table (a structured
+    array with one row per setting) and the location of each setting are stored next to it,
+    so a setting is found with a dict lookup and read as a zero-copy slice of the file.
+    Settings added later with extend go to files of their own, activity_<N>x<T>_<first counter>.npy
+
+    a run that stopped early (params.adaptive without adaptive_fill) has fewer time steps than its
+    row, lengths.npy holds the number of stored time steps of each setting and reads are cut to it
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_file = directory + 'index.pkl'
+        self.table_file = directory + 'parameters.npy'
+        self.lengths_file = directory + 'lengths.npy'
+        self.groups = {}       # group name -> (settings, N, T)
+        self.locations = []    # counter -> (group name, row)
+        self.lookup = {}       # parameter setting -> counter
+        self._arrays = {}
+        self.has_lengths = False
+
+    @staticmethod
+    def exists(directory):
+        return path.isfile(directory + 'index.pkl')
+
+    @staticmethod
+    def group_name(shape):
+        return 'activity_' + str(shape[0]) + 'x' + str(shape[1])
+
+    def create(self, keys, param_space, shapes, dtype=np.float64):
+        '''
+        preallocate one array file per (N, T) group and write the parameter table and index,
+        shapes are those of the stored activity and dtype its precision
+        '''
+        self.keys = list(keys)
+        self._allocate(shapes, dtype)
+        self._write_index(param_space)
+        return self
+
+    def extend(self, param_space, shapes, dtype=np.float64):
+        '''
+        add settings to a created store, param_space is the full new parameter space and shapes
+        those of the added settings at its end. The new settings get array files of their own, the
+        existing files are left as they are, so growing a sweep never copies stored activity
+        '''
+        # the lengths file is rewritten, maps of the old one must not be used any more
+        self.flush()
+        for mode in ['r', 'r+']:
+            self._arrays.pop(('lengths', mode), None)
+        self._allocate(shapes, dtype, suffix='_' + str(len(self.locations)))
+        self._write_index(param_space)
+        return self
+
+    def _allocate(self, shapes, dtype, suffix=''):
+        lengths = np.load(self.lengths_file)[:len(self.locations)] if self.locations else np.zeros(0, dtype=np.int64)
+        np.save(self.lengths_file, np.concatenate((lengths, [shape[1] for shape in shapes])).astype(np.int64))
+        self.has_lengths = True
+
+        rows = {}
+        for shape in shapes:
+            name = self.group_name(shape) + suffix
+            self.locations.append((name, rows.get(name, 0)))
+            rows[name] = rows.get(name, 0) + 1
+            self.groups[name] = (rows[name],) + tuple(shape)
+
+        for name in rows:
+            np.lib.format.open_memmap(self.directory + name + '.npy', mode='w+', dtype=dtype, shape=self.groups[name]).flush()
+
+    def _write_index(self, param_space):
+        np.save(self.table_file, self.parameter_table(self.keys, param_space))
+        with open(self.index_file, "wb") as f:
+            cPickle.dump({'keys': self.keys, 'groups': self.groups, 'locations': self.locations}, f)
+        self._build_lookup(param_space)
+
+    def open(self, param_space=None):
+        with open(self.index_file, "rb") as f:
+            index = cPickle.load(f)
+        self.keys = index['keys']
+        self.groups = index['groups']
+        self.locations = index['locations']
+        # stores written before lengths were kept only hold complete runs
+        self.has_lengths = path.isfile(self.lengths_file)
+        if param_space is None:
+            param_space = [tuple(row) for row in self.table().tolist()]
+        self._build_lookup(param_space)
+        return self
+
+    @staticmethod
+    def parameter_table(keys, param_space):
+        # one column per parameter, numpy picks a compact dtype per column
+        columns = list(zip(*param_space))
+        return np.rec.fromarrays([np.array(column) for column in columns], names=list(keys))
+
+    def table(self):
+        return np.load(self.table_file, allow_pickle=True)
+
+    def _build_lookup(self, param_space):
+        self.lookup = {setting: counter for counter, setting in enumerate(param_space)}
+
+    def _array(self, name, mode='r'):
+        # memory maps are opened lazily and kept, reading a slice does not load the file
+        if (name, mode) not in self._arrays:
+            self._arrays[(name, mode)] = np.load(self.directory + name + '.npy', mmap_mode=mode)
+        return self._arrays[(name, mode)]
+
+    def write(self, counter, R):
+        name, row = self.locations[counter]
+        array = self._array(name, 'r+')
+        array[row, :, :R.shape[1]] = R
+        if R.shape[1] != array.shape[2]:
+            self._array('lengths', 'r+')[counter] = R.shape[1]
+        return array
+
+    def flush(self):
+        for (name, mode), array in self._arrays.items():
+            if mode == 'r+':
+                array.flush()
+
+    def counter(self, parameter_setting):
+        return self.lookup[tuple(parameter_setting)]
+
+    def activity(self, parameter_setting, neurons=slice(None), times=slice(None)):
+        '''
+        activity of one setting, a view into the memory-mapped file for slice arguments
+        (index arrays for neurons or times give a copy of just those entries, an int drops the axis)
+        '''
+        counter = self.counter(parameter_setting)
+        name, row = self.locations[counter]
+        R = self._array(name)[row]
+        if self.has_lengths:
+            R = R[:, :self._array('lengths')[counter]]
+        return select(R, neurons, times)
+
+    def activity_bulk(self, parameter_settings, neurons=slice(None), times=slice(None)):
+        '''
+        the same slice from many settings, stacked into one (settings, neurons, times) array
+        '''
+        return np.stack([self.activity(setting, neurons, times) for setting in parameter_settings])
@@ -0,0 +1,147 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import os
+import os.path as path
+import gzip
+import lzma
+import queue
+import tempfile
+import threading
+import _pickle as cPickle
+
+'''
+pickles written atomically and optionally compressed, and a background thread that writes them
+while the simulation goes on. Compressed files keep their .pkl name, load_pickle recognizes
+the format from the first bytes, so readers do not need to know how a file was written
+'''
+
+COMPRESSION = {None: open, 'gzip': gzip.open, 'lzma': lzma.open}
+MAGIC = ((b'\x1f\x8b', gzip.open), (b'\xfd7zXZ\x00', lzma.open))
+
+def dump_pickle(data, filename, compression=None, fsync=False):
+    '''
+    write to a temporary file next to filename, then rename, a crash never leaves a partial file
+    '''
+    if compression not in COMPRESSION:
+        raise Exception("Keyword '" + str(compression) + "' is not a valid compression. Please choose None, 'gzip' or 'lzma'.")
+    handle, temporary = tempfile.mkstemp(dir=path.dirname(filename), suffix='.tmp')
+    os.close(handle)
+    try:
+        with COMPRESSION[compression](temporary, "wb") as f:
+            cPickle.dump(data, f)
+        if fsync:
+            with open(temporary, "rb+") as f:
+                os.fsync(f.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        if path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def load_pickle(filename):
+    with open(filename, "rb") as f:
+        start = f.read(6)
+    opener = open
+    for magic, compressed_open in MAGIC:
+        if start.startswith(magic):
+            opener = compressed_open
+    with opener(filename, "rb") as f:
+        return cPickle.load(f)
+
+def fsync_directory(directory):
+    # makes the renames of the files in directory durable
+    handle = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(handle)
+    finally:
+        os.close(handle)
+
+
+class BackgroundWriter:
+    '''
+    runs write jobs on a background thread, fed by a bounded queue
+
+    submit blocks while maxsize jobs are waiting, so a slow disk slows the producer down
+    instead of letting finished networks pile up in memory. An error in a job is raised by the
+    next submit or by close. close waits for all jobs, fsyncs the directories written to and
+    stops the thread, use the writer as a context manager so this also happens on errors
+
+        with BackgroundWriter(maxsize=8, compression='gzip') as writer:
+            writer.dump(net, sim_dir + '0.pkl')
+    '''
+    def __init__(self, maxsize=8, compression=None, fsync=True):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.compression = compression
+        self.fsync = fsync
+        self.directories = set()
+        self.error = None
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        # an error of the producer takes precedence over one of the writer
+        self.close(raise_error=exc[0] is None)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._work, name='BackgroundWriter', daemon=True)
+            self.thread.start()
+        return self
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                if self.error is None:
+                    function, args = job
+                    function(*args)
+            except BaseException as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, function, *args, directories=()):
+        '''
+        queue function(*args), runs in order with the other jobs. directories are the ones the job
+        writes to, they are fsynced by flush and close like those of dump
+        '''
+        self._raise()
+        self.directories.update(path.normpath(directory) for directory in directories)
+        if self.thread is None:
+            self.start()
+        self.queue.put((function, args))
+
+    def dump(self, data, filename):
+        self.submit(dump_pickle, data, filename, self.compression, self.fsync, directories=[path.dirname(filename)])
+
+    def flush(self):
+        '''
+        wait until every queued job is written
+        '''
+        self.queue.join()
+        if self.fsync:
+            for directory in self.directories:
+                fsync_directory(directory)
+        self._raise()
+
+    def close(self, raise_error=True):
+        if self.thread is not None:
+            self.queue.join()
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.fsync:
+            for directory in self.directories:
+                fsync_directory(directory)
+        if raise_error:
+            self._raise()
@@ -0,0 +1,34 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import os
+import warnings
+import numpy as np
+import pytest
+
+from submanifolds.ringnet import RingNetwork, Parameters
+from submanifolds.experiments import weight_matrix_experiment
+from submanifolds.utils import load
+
+@pytest.fixture(scope='session', autouse=True)
+def data_root(tmp_path_factory):
+    '''
+    experiments and DataManager use a temporary root instead of the directory above the repository
+    '''
+    root = str(tmp_path_factory.mktemp('root')) + '/'
+    os.mkdir(root + 'data')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(weight_matrix_experiment, 'get_root', lambda: root)
+        monkeypatch.setattr(load, 'get_root', lambda: root)
+        yield root
+
+def network(**values):
+    with warnings.catch_warnings():
+        # rescaling warnings of selective inhibition
+        warnings.simplefilter('ignore')
+        return RingNetwork(Parameters({'keys': list(values), 'setting': list(values.values())}))
+
+def assert_close(R, reference, rtol=1e-10):
+    # relative to the largest rate, entries near zero only carry rounding noise
+    assert R.shape == reference.shape
+    assert np.max(np.abs(R - reference)) <= rtol * max(np.max(np.abs(reference)), np.finfo(float).tiny)
@@ -0,0 +1,17 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+from submanifolds.ringnet import BatchRunner, BumpCenter
+from conftest import network, assert_close
+
+def test_batch_matches_serial():
+    settings = [dict(N=80, T=60, seed=seed, p_inh=p_inh) for seed in [0, 1] for p_inh in [0.5, 1]]
+    batched = [network(**values) for values in settings]
+    BatchRunner(batched, batch_size=3).run([BumpCenter()], record=True)
+    for values, net in zip(settings, batched):
+        serial = network(**values)
+        serial.run([BumpCenter()], record=True)
+        assert_close(net.R, serial.R)
+        assert np.allclose(net.statistics['bump_center'], serial.statistics['bump_center'], equal_nan=True)
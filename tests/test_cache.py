@@ -0,0 +1,28 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+from submanifolds.ringnet import RingNetwork
+from submanifolds.experiments import Experiment
+from submanifolds.utils import ResultCache
+
+def test_cache_hit_and_miss(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), salt='test')
+    first = Experiment({'N': [60], 'T': [40]}, {'seed': [0, 1]}, cache=cache)
+    first.iterate()
+    assert len(list(tmp_path.glob('*.pkl'))) == 2
+
+    # a widened sweep loads the cached settings and simulates only the new one
+    simulated = []
+    run = RingNetwork.run
+    def counting_run(net, *args, **kwargs):
+        simulated.append(net.params.seed)
+        return run(net, *args, **kwargs)
+    monkeypatch.setattr(RingNetwork, 'run', counting_run)
+    second = Experiment({'N': [60], 'T': [40]}, {'seed': [0, 1, 2]}, cache=cache)
+    second.iterate()
+    assert simulated == [2]
+    for setting, R in first.activity.items():
+        assert np.array_equal(second.activity[setting], R)
+    assert len(list(tmp_path.glob('*.pkl'))) == 3
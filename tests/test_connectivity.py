@@ -0,0 +1,12 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+from conftest import network, assert_close
+
+def test_sparse_without_jitter_matches_dense():
+    values = dict(N=150, T=80, shift_percent=0.02, p_inh=0.5)
+    dense = network(**values)
+    dense.run(record=True)
+    sparse = network(connectivity='sparse', cutoff=None, **values)
+    sparse.run(record=True)
+    assert_close(sparse.R, dense.R)
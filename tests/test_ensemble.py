@@ -0,0 +1,22 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import numpy as np
+
+from submanifolds.ringnet import RunningMoments
+
+def test_running_moments_match_numpy():
+    rng = np.random.RandomState(0)
+    samples = rng.normal(3, 2, size=(101, 4, 5))
+    samples[rng.random_sample(samples.shape) < 0.1] = np.nan
+
+    moments = RunningMoments((4, 5))
+    for start in range(0, 60, 7):
+        moments.add(samples[start:min(start + 7, 60)])
+    rest = RunningMoments((4, 5))
+    rest.add(samples[60:])
+    moments.merge(rest)
+
+    assert np.array_equal(moments.count, np.sum(~np.isnan(samples), axis=0))
+    assert np.allclose(moments.mean, np.nanmean(samples, axis=0))
+    assert np.allclose(moments.variance, np.nanvar(samples, axis=0, ddof=1))
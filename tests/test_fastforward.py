@@ -0,0 +1,35 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import pytest
+
+from submanifolds.ringnet import BumpCenter
+from conftest import network, assert_close
+
+@pytest.mark.parametrize('values', [
+    dict(stim='persistent', r_E_in=1.0, _w_E=0.5, _w_I=0.05),  # linear, stretches are skipped
+    dict(shift_percent=0.02),                                   # rectified at every step
+])
+@pytest.mark.parametrize('record_every', [1, 25])
+def test_fast_forward_matches_stepped(values, record_every):
+    values = dict(N=200, T=300, record_every=record_every, **values)
+    stepped = network(**values)
+    stepped.run(record=True)
+    skipped = network(fast_forward=True, **values)
+    skipped.run(record=True)
+    assert_close(skipped.R, stepped.R, 1e-9)
+    # with an observer every step is taken
+    observed = network(fast_forward=True, **values)
+    observed.run([BumpCenter()], record=True)
+    assert_close(observed.R, stepped.R, 1e-9)
+
+@pytest.mark.parametrize('p_inh', [0.1, 0.5])
+def test_fast_forward_projection_default_N(p_inh):
+    # ill-conditioned eigenbasis at the default N, fast forward falls back to regular steps
+    values = dict(T=50, type='projection', p_inh=p_inh)
+    stepped = network(**values)
+    stepped.run(record=True)
+    skipped = network(fast_forward=True, **values)
+    with pytest.warns(UserWarning, match='ill-conditioned'):
+        skipped.run(record=True)
+    assert_close(skipped.R, stepped.R, 1e-9)
@@ -0,0 +1,17 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import pytest
+
+from conftest import network, assert_close
+
+@pytest.mark.parametrize('input_type', ['additive', 'projection'])
+@pytest.mark.parametrize('stim', ['transient', 'persistent'])
+@pytest.mark.parametrize('N', [100, 101])
+def test_fft_matches_dense(input_type, stim, N):
+    values = dict(N=N, T=100, type=input_type, stim=stim, p_inh=0.5, shift_percent=0.02)
+    dense = network(engine='dense', **values)
+    dense.run(record=True)
+    fft = network(engine='fft', **values)
+    fft.run(record=True)
+    assert_close(fft.R, dense.R)
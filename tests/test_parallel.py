@@ -0,0 +1,19 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import warnings
+
+from submanifolds.experiments import Experiment
+from conftest import assert_close
+
+def test_parallel_matches_serial():
+    results = {}
+    for workers in [None, 2]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            experiment = Experiment({'N': [60], 'T': [40]}, {'seed': [0, 1, 2], 'p_inh': [0.5, 1]}, workers=workers)
+            experiment.iterate()
+        results[workers] = experiment
+    for setting, R in results[None].activity.items():
+        assert R.dtype == results[2].activity[setting].dtype
+        assert_close(results[2].activity[setting], R)
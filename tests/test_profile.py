@@ -0,0 +1,28 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import pickle
+import threading
+
+from submanifolds.utils import Profiler
+from submanifolds.utils import profile
+
+def test_phases_from_several_threads():
+    def record():
+        for _ in range(1000):
+            with profile.phase('save'):
+                profile.count('bytes', 2)
+
+    with Profiler() as profiler:
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert profiler.totals['save'][0] == 4000
+    assert profiler.counters['bytes'] == 8000
+    assert len(profiler.events) == 4000
+
+    # sent back from a worker process without its lock, and merged
+    merged = Profiler().merge(pickle.loads(pickle.dumps(profiler)))
+    assert merged.report()['phases']['save']['calls'] == 4000
@@ -0,0 +1,14 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import pytest
+
+from conftest import network, assert_close
+
+@pytest.mark.parametrize('record_neurons', [5, [5]])
+def test_single_recorded_neuron(record_neurons):
+    full = network(N=100, T=50)
+    full.run(record=True)
+    net = network(N=100, T=50, record_neurons=record_neurons)
+    net.run(record=True)
+    assert_close(net.R, full.R[5:6])
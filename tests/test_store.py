@@ -0,0 +1,48 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import os.path as path
+import warnings
+import numpy as np
+import pytest
+
+from submanifolds.experiments import WeightMatrixExperiment
+from submanifolds.utils import DataManager
+
+SELECTORS = [
+    (3, slice(None)),
+    (slice(None), 7),
+    (3, 7),
+    (slice(10, 20), slice(5, 15, 2)),
+    (np.array([1, 5, 9]), slice(None)),
+    (slice(None), np.array([0, 4, 8])),
+    (np.array([1, 5, 9]), np.array([0, 4])),
+    ([2, 4], 6),
+]
+
+@pytest.fixture(scope='module', params=['array', 'pickle'])
+def experiment(request):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        experiment = WeightMatrixExperiment({'N': [40], 'T': [30]}, {'seed': [0, 1]}, name='test_store_' + request.param,
+                                            backend=request.param)
+        experiment.iterate()
+    return experiment, DataManager(path.basename(experiment.exp_dir[:-1]))
+
+@pytest.mark.parametrize('neurons, times', SELECTORS)
+def test_load_activity_selectors(experiment, neurons, times):
+    experiment, data = experiment
+    setting = experiment.param_space[1]
+    R = np.asarray(data.load_data(setting).R)
+    if np.ndim(neurons) == 1 and np.ndim(times) == 1:
+        expected = R[np.ix_(neurons, times)]
+    else:
+        expected = R[neurons, times]
+    activity = data.load_activity(setting, neurons, times)
+    assert activity.shape == expected.shape
+    assert np.array_equal(activity, expected)
+
+def test_load_activity_bulk(experiment):
+    experiment, data = experiment
+    bulk = data.load_activity_bulk(experiment.param_space, 3, slice(0, 10))
+    assert bulk.shape == (2, 10)
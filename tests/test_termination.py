@@ -0,0 +1,101 @@
+# Copyright 2023 Andrew Lehr
+# The MIT License
+
+import itertools
+import os.path as path
+import warnings
+import numpy as np
+import pytest
+
+from submanifolds.ringnet import RingNetwork, Parameters, BumpCenter, TotalActivity
+from submanifolds.ringnet.termination import SteadyStateDetector
+from submanifolds.experiments import WeightMatrixExperiment
+from submanifolds.utils import DataManager
+
+N = 50
+
+def detector(absorbing=True):
+    params = Parameters({'keys': ['N'], 'setting': [N]})
+    params.adaptive_patience = 3
+    return SteadyStateDetector(params, 1.0, 0.0 if absorbing else 1.0)
+
+def bump(scale=1.0):
+    return scale * np.exp(-(np.arange(N) - N // 2)**2 / 20.0)
+
+def run(detector, states):
+    for t in range(len(states) - 1):
+        steady = detector.check(states[t], states[t + 1])
+        if steady is not None:
+            return t + 1, steady
+    return None, None
+
+def test_extinction_needs_patience():
+    states = [bump()] + [np.zeros(N)] * 5
+    step, steady = run(detector(), states)
+    assert step == 3 and steady[0] == 'extinction'
+
+def test_extinction_is_relative_to_peak():
+    # a steady bump far below any absolute threshold is not extinct
+    states = [bump(1e-20)] * 6
+    step, steady = run(detector(), states)
+    assert steady[0] == 'fixed_point'
+
+def test_no_extinction_with_drive():
+    states = [bump()] + [np.zeros(N)] * 5
+    step, steady = run(detector(absorbing=False), states)
+    assert steady is None
+
+def test_decaying_travelling_bump():
+    states = [0.9**t * np.roll(bump(), 2 * t) for t in range(10)]
+    d = detector()
+    step, steady = run(d, states)
+    reason, period, shift, factor = steady
+    assert (reason, period, shift) == ('travelling', 1, 2)
+    assert np.isclose(factor, 0.9)
+    later = list(itertools.islice(d.extend(states[step], period, shift, factor), 10 - step - 1))
+    assert np.allclose(later, states[step + 1:])
+
+def test_growing_periodic_state():
+    states = [1.1**t * (bump() if t % 2 == 0 else np.roll(bump(), N // 2)) for t in range(10)]
+    step, steady = run(detector(), states)
+    assert steady[0] in ('travelling', 'periodic')
+    assert np.isclose(steady[3]**(1 / steady[1]), 1.1)
+
+def test_fill_matches_full_run():
+    keys = ['N', 'T', '_w_E']
+    full = RingNetwork(Parameters({'keys': keys, 'setting': [100, 200, 2.0]}))
+    full.run(record=True)
+    adaptive = RingNetwork(Parameters({'keys': keys + ['adaptive'], 'setting': [100, 200, 2.0, True]}))
+    adaptive.run(record=True)
+    assert adaptive.termination['step'] < 200
+    assert np.allclose(adaptive.R, full.R, rtol=0, atol=1e-12 * np.max(full.R))
+
+def test_early_stop_observers_are_nan():
+    # without fill the steps after the stop were never simulated, the series must not read as zero rates
+    keys = ['N', 'T', 'adaptive', 'adaptive_fill', '_w_E']
+    net = RingNetwork(Parameters({'keys': keys, 'setting': [100, 200, True, False, 2.0]}))
+    net.run([BumpCenter(), TotalActivity()], record=True)
+    step = net.termination['step']
+    assert step < 200
+    for name in ['bump_center', 'total_activity']:
+        series = net.statistics[name]
+        assert len(series) == 200
+        assert np.all(np.isfinite(series[:step])) and np.all(np.isnan(series[step:]))
+
+@pytest.mark.parametrize('backend, workers', [('array', None), ('array', 2), ('pickle', None), ('pickle', 2)])
+def test_early_stop_shapes(backend, workers):
+    # without fill a run that stopped early is as long in every storage path as in a serial run
+    keys = ['N', 'T', 'adaptive', 'adaptive_fill', '_w_E']
+    setting = [100, 50, True, False, 0.5]
+    net = RingNetwork(Parameters({'keys': keys, 'setting': setting}))
+    net.run(record=True)
+    assert net.R.shape[1] < 50
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        experiment = WeightMatrixExperiment({key: [value] for key, value in zip(keys, setting)}, {'seed': [0, 1]},
+                                            name='test_termination_' + backend + '_' + str(workers), backend=backend, workers=workers)
+        experiment.iterate()
+    data = DataManager(path.basename(experiment.exp_dir[:-1]))
+    for parameter_setting in experiment.param_space:
+        assert data.load_activity(parameter_setting).shape == net.R.shape